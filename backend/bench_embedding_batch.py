@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of single-image vs batched Facenet embeddings on CPU.
+
+Embeds the same synthetic face crops one call per crop and then in batches
+through compute_face_embeddings, as the micro-batcher does at peak hour.
+
+    python bench_embedding_batch.py --crops 64 --batch-sizes 1 4 8 16
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from face_pipeline import compute_face_embedding, compute_face_embeddings, warm_up_face_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--crops", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    crops = [rng.integers(0, 256, (160, 160, 3), dtype=np.uint8) for _ in range(args.crops)]
+
+    warm_up_face_models()
+    for batch_size in args.batch_sizes:
+        # First batch of a new shape builds the graph; keep it out of the timing
+        compute_face_embeddings(crops[:batch_size])
+
+    start = time.perf_counter()
+    single = [compute_face_embedding(crop) for crop in crops]
+    elapsed = time.perf_counter() - start
+    print(f"single calls: {args.crops / elapsed:.1f} crops/s")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        batched = []
+        for i in range(0, len(crops), batch_size):
+            batched.extend(compute_face_embeddings(crops[i:i + batch_size]))
+        elapsed = time.perf_counter() - start
+        max_diff = max(float(np.max(np.abs(a - b))) for a, b in zip(single, batched))
+        print(f"batch_size={batch_size}: {args.crops / elapsed:.1f} crops/s (max diff vs single={max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Recall / latency benchmark of the approximate face index against exact search.
+
+Uses synthetic Facenet-like embeddings: each simulated visitor has a random
+identity vector and queries are noisy captures of a registered visitor.
+
+    python bench_face_index.py --users 100000 --queries 500 --lists 512 --nprobe 16
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from face_index import ExactFaceIndex, IVFFaceIndex
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(np.asarray(samples) * 1000.0, q))
+
+
+def run_queries(index, queries, k):
+    results = []
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k=k))
+        timings.append(time.perf_counter() - start)
+    return results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--lists", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--noise", type=float, default=0.35, help="capture noise relative to identity norm")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    identities = rng.standard_normal((args.users, args.dim)).astype(np.float32)
+    ids = [f"user-{i}" for i in range(args.users)]
+
+    exact = ExactFaceIndex(args.dim)
+    ivf = IVFFaceIndex(args.dim, n_lists=args.lists, nprobe=args.nprobe)
+
+    start = time.perf_counter()
+    for user_id, vector in zip(ids, identities):
+        exact.add(user_id, vector)
+    exact_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user_id, vector in zip(ids, identities):
+        ivf.add(user_id, vector)
+    if not ivf.trained:
+        ivf.train()
+    ivf_build = time.perf_counter() - start
+
+    picked = rng.choice(args.users, args.queries, replace=False)
+    noise = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    noise *= args.noise * np.linalg.norm(identities[picked], axis=1, keepdims=True) / np.sqrt(args.dim)
+    queries = identities[picked] + noise
+
+    exact_results, exact_timings = run_queries(exact, queries, args.k)
+    ivf_results, ivf_timings = run_queries(ivf, queries, args.k)
+
+    recall = np.mean([
+        len({hit for hit, _ in approx} & {hit for hit, _ in truth}) / max(1, len(truth))
+        for approx, truth in zip(ivf_results, exact_results)
+    ])
+
+    print(f"users={args.users} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"exact: build={exact_build:.2f}s p50={percentile_ms(exact_timings, 50):.2f}ms p99={percentile_ms(exact_timings, 99):.2f}ms")
+    print(f"ivf(lists={args.lists}, nprobe={args.nprobe}): build={ivf_build:.2f}s "
+          f"p50={percentile_ms(ivf_timings, 50):.2f}ms p99={percentile_ms(ivf_timings, 99):.2f}ms")
+    print(f"ivf recall@{args.k} vs exact: {recall:.4f}")
+
+
+if __name__ == "__main__":
+    main()
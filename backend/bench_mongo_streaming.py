@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the streamed user load against a local MongoDB.
+
+Seeds a throwaway database with N synthetic users (compact face photo
+placeholder plus a Facenet-sized embedding), then measures how long it takes
+to stream them into the face index and the peak Python memory used, for
+several cursor batch sizes.
+
+    MONGO_URL=mongodb://localhost:27017 python bench_mongo_streaming.py --users 10000 100000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from face_index import ExactFaceIndex
+
+EMBEDDING_DIM = 128
+PROJECTION = {"face_embedding": 1, "face_embedding_model": 1, "face_embedding_version": 1, "nome": 1}
+
+
+async def seed(collection, users: int, photo_bytes: int, rng):
+    await collection.drop()
+    photo = "A" * photo_bytes
+    batch = []
+    for i in range(users):
+        batch.append({
+            "nome": f"Visitante {i}",
+            "cpf": f"{i:011d}",
+            "telefone": "92999999999",
+            "face_image": photo,
+            "face_embedding": rng.standard_normal(EMBEDDING_DIM).astype("<f4").tobytes(),
+            "face_embedding_model": "Facenet",
+            "face_embedding_version": 1,
+            "ja_votou": False,
+        })
+        if len(batch) == 1000:
+            await collection.insert_many(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch)
+
+
+async def stream_into_index(collection, batch_size: int) -> int:
+    index = ExactFaceIndex(EMBEDDING_DIM)
+    async for doc in collection.find({}, PROJECTION).batch_size(batch_size):
+        index.add(str(doc["_id"]), np.frombuffer(doc["face_embedding"], dtype="<f4"))
+    return len(index)
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[args.db]
+    rng = np.random.default_rng(args.seed)
+
+    try:
+        for users in args.users:
+            await seed(db.usuarios, users, args.photo_bytes, rng)
+            print(f"users={users} photo_bytes={args.photo_bytes}")
+            for batch_size in args.batch_sizes:
+                tracemalloc.start()
+                start = time.perf_counter()
+                loaded = await stream_into_index(db.usuarios, batch_size)
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"  batch_size={batch_size}: loaded={loaded} time={elapsed:.2f}s peak_mem={peak / 1e6:.1f}MB")
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--photo-bytes", type=int, default=20000, help="size of the stored face_image placeholder")
+    parser.add_argument("--db", default="votacao_benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database afterwards")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark: many concurrent voters on a single turma.
+
+Compares incrementing one counter field on the turma document (which also
+carries a large photo) with incrementing one of N shard documents in a
+separate counters collection, against a local MongoDB.
+
+    MONGO_URL=mongodb://localhost:27017 python bench_vote_counters.py --votes 5000 --concurrency 200 --shards 1 8 32
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+
+async def run_voters(votes: int, concurrency: int, vote_once):
+    latencies = []
+    remaining = iter(range(votes))
+
+    async def voter():
+        for _ in remaining:
+            start = time.perf_counter()
+            await vote_once()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[voter() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return elapsed, p50, p99
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), maxPoolSize=args.concurrency)
+    db = client[args.db]
+
+    try:
+        await db.turmas.drop()
+        result = await db.turmas.insert_one({
+            "nome_turma": "Turma Popular",
+            "nome_projeto": "Projeto",
+            "numero_barraca": "1",
+            "foto_base64": "A" * args.photo_bytes,
+            "votos_count": 0,
+        })
+        turma_oid = result.inserted_id
+        turma_id = str(turma_oid)
+
+        async def single_document():
+            await db.turmas.update_one({"_id": turma_oid}, {"$inc": {"votos_count": 1}})
+
+        elapsed, p50, p99 = await run_voters(args.votes, args.concurrency, single_document)
+        print(f"single turma document: {args.votes / elapsed:.0f} votes/s p50={p50:.2f}ms p99={p99:.2f}ms")
+
+        for shards in args.shards:
+            await db.turma_contadores.drop()
+
+            async def sharded():
+                shard = random.randrange(shards)
+                await db.turma_contadores.update_one(
+                    {"_id": f"{turma_id}:{shard}"},
+                    {"$inc": {"count": 1}, "$setOnInsert": {"turma_id": turma_id, "shard": shard}},
+                    upsert=True,
+                )
+
+            elapsed, p50, p99 = await run_voters(args.votes, args.concurrency, sharded)
+            total = 0
+            async for doc in db.turma_contadores.aggregate([{"$group": {"_id": "$turma_id", "total": {"$sum": "$count"}}}]):
+                total = doc["total"]
+            print(f"shards={shards}: {args.votes / elapsed:.0f} votes/s p50={p50:.2f}ms p99={p99:.2f}ms (sum={total})")
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--votes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--photo-bytes", type=int, default=500000, help="size of the turma photo placeholder")
+    parser.add_argument("--db", default="votacao_benchmark")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database afterwards")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Face embedding indexes used to identify visitors.
+
+ExactFaceIndex scans every stored embedding with one matrix-vector product.
+IVFFaceIndex clusters embeddings into inverted lists and only scans the lists
+closest to the query, trading a little recall for sub-linear search.
+"""
+
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_embedding(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return vector
+    return vector / norm
+
+
+def index_fingerprint(count: int, last_id: str) -> str:
+    """Identify a set of ids by its size and largest id (ids are ObjectId hex
+    strings, so the largest one is also the most recent)."""
+    return f"{count}:{last_id}"
+
+
+def write_index_file(path: str, state: dict):
+    # Each process writes its own temporary file, so concurrent saves from
+    # several API workers never interleave; the rename is atomic.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as fh:
+            np.savez(fh, **state)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class _Rows:
+    """Growable float32 matrix with parallel ids and O(1) swap-removal."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, user_id: str, vector: np.ndarray) -> int:
+        size = len(self.ids)
+        # Grow capacity geometrically so inserts stay amortized O(dim)
+        if size == self.matrix.shape[0]:
+            capacity = max(64, self.matrix.shape[0] * 2)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:size] = self.matrix[:size]
+            self.matrix = grown
+        self.matrix[size] = vector
+        self.ids.append(user_id)
+        return size
+
+    def remove(self, row: int) -> Optional[str]:
+        """Remove a row by moving the last one into its place.
+
+        Returns the id of the moved row (None if the removed row was last)."""
+        last = len(self.ids) - 1
+        moved = None
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            moved = self.ids[row]
+        self.ids.pop()
+        return moved
+
+    def view(self) -> np.ndarray:
+        return self.matrix[:len(self.ids)]
+
+
+def _top_k(ids: List[str], distances: np.ndarray, k: int) -> List[Tuple[str, float]]:
+    size = distances.shape[0]
+    if size == 0:
+        return []
+    k = min(k, size)
+    if k < size:
+        candidates = np.argpartition(distances, k - 1)[:k]
+    else:
+        candidates = np.arange(size)
+    candidates = candidates[np.argsort(distances[candidates])]
+    return [(ids[i], float(distances[i])) for i in candidates]
+
+
+class BaseFaceIndex:
+    """Common interface of the face indexes.
+
+    Embeddings are L2-normalized on insert and distances are cosine distances
+    (1 - cosine similarity), the same metric DeepFace uses for Facenet."""
+
+    kind = "base"
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, user_id: str) -> bool:
+        raise NotImplementedError
+
+    def add(self, user_id: str, embedding):
+        raise NotImplementedError
+
+    def remove(self, user_id: str) -> bool:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, embedding, k: int = 1) -> List[Tuple[str, float]]:
+        """Return up to k (user_id, cosine_distance) pairs, nearest first."""
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        raise NotImplementedError
+
+    def _check(self, embedding) -> np.ndarray:
+        vector = normalize_embedding(embedding)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Expected embedding of size {self.dim}, got {vector.shape[0]}")
+        return vector
+
+    # Persistence
+    def _extra_state(self) -> dict:
+        return {}
+
+    def _restore_extra_state(self, state):
+        pass
+
+    def _export(self) -> Tuple[List[str], np.ndarray]:
+        ids = []
+        vectors = np.zeros((len(self), self.dim), dtype=np.float32)
+        for row, (user_id, vector) in enumerate(self.items()):
+            ids.append(user_id)
+            vectors[row] = vector
+        return ids, vectors
+
+    def snapshot(self) -> dict:
+        """Copy the index content into arrays for write_index_file().
+
+        Taken on the event loop, so the slow part (writing the file) can run
+        in a thread while the index keeps changing."""
+        ids, vectors = self._export()
+        return {
+            "kind": np.array(self.kind),
+            "dim": np.array(self.dim),
+            "fingerprint": np.array(index_fingerprint(len(ids), max(ids, default=""))),
+            "ids": np.array(ids, dtype=str),
+            "vectors": vectors,
+            **{name: np.array(value, copy=True) for name, value in self._extra_state().items()},
+        }
+
+    def save(self, path: str):
+        write_index_file(path, self.snapshot())
+
+    def load(self, path: str) -> str:
+        """Replace the index content with a file written by save().
+
+        Returns the fingerprint of the content it was saved with."""
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["kind"]) != self.kind or int(data["dim"]) != self.dim:
+                raise ValueError(f"Index file {path} was written by a different index configuration")
+            self.clear()
+            self._restore_extra_state(data)
+            for user_id, vector in zip(data["ids"], data["vectors"]):
+                self.add(str(user_id), vector)
+            return str(data["fingerprint"])
+
+
+class ExactFaceIndex(BaseFaceIndex):
+    """Brute-force search over one N x dim matrix."""
+
+    kind = "exact"
+
+    def __init__(self, dim: int = 128):
+        super().__init__(dim)
+        self._rows = _Rows(dim)
+        self._where: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._where
+
+    def add(self, user_id: str, embedding):
+        vector = self._check(embedding)
+        if user_id in self._where:
+            self._rows.matrix[self._where[user_id]] = vector
+            return
+        self._where[user_id] = self._rows.append(user_id, vector)
+
+    def remove(self, user_id: str) -> bool:
+        row = self._where.pop(user_id, None)
+        if row is None:
+            return False
+        moved = self._rows.remove(row)
+        if moved is not None:
+            self._where[moved] = row
+        return True
+
+    def clear(self):
+        self._rows = _Rows(self.dim)
+        self._where = {}
+
+    def search(self, embedding, k: int = 1) -> List[Tuple[str, float]]:
+        if len(self._rows) == 0:
+            return []
+        query = normalize_embedding(embedding)
+        distances = 1.0 - self._rows.view() @ query
+        return _top_k(self._rows.ids, distances, k)
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        matrix = self._rows.view()
+        for row, user_id in enumerate(self._rows.ids):
+            yield user_id, matrix[row]
+
+    def _export(self) -> Tuple[List[str], np.ndarray]:
+        return list(self._rows.ids), self._rows.view().copy()
+
+
+class IVFFaceIndex(BaseFaceIndex):
+    """Inverted-file index: embeddings are bucketed by their nearest k-means
+    centroid and a query only scans the nprobe closest buckets.
+
+    Until enough embeddings exist to train the centroids, everything lives in
+    a single list and search is exact."""
+
+    kind = "ivf"
+
+    def __init__(self, dim: int = 128, n_lists: int = 256, nprobe: int = 8,
+                 train_min_per_list: int = 39, kmeans_iterations: int = 15, seed: int = 0):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_min_per_list = train_min_per_list
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.clear()
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._where
+
+    def clear(self):
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_Rows] = [_Rows(self.dim)]
+        self._where: Dict[str, Tuple[int, int]] = {}
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.zeros(vectors.shape[0], dtype=np.int64)
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def _insert(self, user_id: str, vector: np.ndarray, list_no: int):
+        self._where[user_id] = (list_no, self._lists[list_no].append(user_id, vector))
+
+    def add(self, user_id: str, embedding):
+        vector = self._check(embedding)
+        self.remove(user_id)
+        self._insert(user_id, vector, int(self._assign(vector[None, :])[0]))
+
+        if not self.trained and len(self) >= self.n_lists * self.train_min_per_list:
+            self.train()
+
+    def remove(self, user_id: str) -> bool:
+        where = self._where.pop(user_id, None)
+        if where is None:
+            return False
+        list_no, row = where
+        moved = self._lists[list_no].remove(row)
+        if moved is not None:
+            self._where[moved] = (list_no, row)
+        return True
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for rows in self._lists:
+            matrix = rows.view()
+            for row, user_id in enumerate(rows.ids):
+                yield user_id, matrix[row]
+
+    def train(self):
+        """Run spherical k-means over the stored embeddings and re-bucket them."""
+        ids = []
+        vectors = np.zeros((len(self), self.dim), dtype=np.float32)
+        for row, (user_id, vector) in enumerate(self.items()):
+            ids.append(user_id)
+            vectors[row] = vector
+
+        n_lists = min(self.n_lists, len(ids))
+        if n_lists == 0:
+            return
+
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(len(ids), n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # Re-seed empty lists with random embeddings
+            empty = np.flatnonzero(counts == 0)
+            if empty.size:
+                sums[empty] = vectors[rng.choice(len(ids), empty.size, replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0.0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        self._centroids = centroids
+        self._lists = [_Rows(self.dim) for _ in range(n_lists)]
+        self._where = {}
+        for user_id, vector, list_no in zip(ids, vectors, self._assign(vectors)):
+            self._insert(user_id, vector, int(list_no))
+
+    def search(self, embedding, k: int = 1) -> List[Tuple[str, float]]:
+        if len(self) == 0:
+            return []
+        query = normalize_embedding(embedding)
+
+        if self._centroids is None:
+            probes = [0]
+        else:
+            similarities = self._centroids @ query
+            nprobe = min(self.nprobe, similarities.shape[0])
+            probes = np.argpartition(-similarities, nprobe - 1)[:nprobe]
+
+        ids: List[str] = []
+        distances = []
+        for list_no in probes:
+            rows = self._lists[int(list_no)]
+            if len(rows) == 0:
+                continue
+            ids.extend(rows.ids)
+            distances.append(1.0 - rows.view() @ query)
+
+        if not distances:
+            return []
+        return _top_k(ids, np.concatenate(distances), k)
+
+    def _extra_state(self) -> dict:
+        if self._centroids is None:
+            return {"centroids": np.zeros((0, self.dim), dtype=np.float32)}
+        return {"centroids": self._centroids}
+
+    def _restore_extra_state(self, state):
+        centroids = state["centroids"]
+        if centroids.shape[0]:
+            self._centroids = centroids.astype(np.float32)
+            self._lists = [_Rows(self.dim) for _ in range(centroids.shape[0])]
+
+
+def create_face_index(backend: str, dim: int = 128, **options) -> BaseFaceIndex:
+    if backend == "exact":
+        return ExactFaceIndex(dim)
+    if backend == "ivf":
+        return IVFFaceIndex(dim, **options)
+    raise ValueError(f"Unknown face index backend: {backend}")
@@ -0,0 +1,247 @@
+"""
+Face processing pipeline: image decoding, face detection and Facenet embeddings.
+
+Everything here is CPU bound and runs in the face workers (see face_worker.py),
+never on the API event loop. DeepFace, and TensorFlow with it, is imported on
+first use so that importing this module stays cheap for the API process.
+"""
+
+import base64
+import io
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image as PILImage
+
+load_dotenv(Path(__file__).parent / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Image normalization settings
+# Camera frames are decoded once and downscaled to what detection needs;
+# only a small JPEG around the face is stored on the user document.
+FACE_IMAGE_MAX_SIDE = int(os.environ.get('FACE_IMAGE_MAX_SIDE', '640'))
+FACE_STORED_MAX_SIDE = int(os.environ.get('FACE_STORED_MAX_SIDE', '320'))
+FACE_STORED_MARGIN = 0.5
+FACE_IMAGE_JPEG_QUALITY = int(os.environ.get('FACE_IMAGE_JPEG_QUALITY', '85'))
+
+# Face detection settings
+# Detection runs once per image; its aligned crop is what gets embedded.
+FACE_DETECTOR_BACKEND = os.environ.get('FACE_DETECTOR_BACKEND', 'opencv')
+FACE_MIN_CONFIDENCE = 0.20
+FACE_MIN_SIZE = 40
+
+# Face embedding settings
+# Embeddings are stored next to each user so a lookup only needs to run
+# Facenet once (for the query image) instead of once per registered user.
+FACE_MODEL_NAME = "Facenet"
+FACE_EMBEDDING_VERSION = 1
+
+# Helper function to load DeepFace (and TensorFlow) only where faces are processed
+def get_deepface():
+    from deepface import DeepFace
+    return DeepFace
+
+# Helper function to decode base64 image
+def base64_to_image(base64_string):
+    try:
+        # Remove header if present
+        if ',' in base64_string:
+            base64_string = base64_string.split(',')[1]
+
+        img_data = base64.b64decode(base64_string)
+        img = PILImage.open(io.BytesIO(img_data)).convert('RGB')
+        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    except Exception as e:
+        logger.error(f"Error decoding base64 image: {e}")
+        return None
+
+# Helper function to shrink an image so its longest side is at most max_side
+def downscale_image(img_array, max_side: int):
+    height, width = img_array.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return img_array
+    scale = max_side / longest
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(img_array, size, interpolation=cv2.INTER_AREA)
+
+# Helper function to encode an image as JPEG bytes
+def image_to_jpeg(img_array, quality: int = FACE_IMAGE_JPEG_QUALITY) -> bytes:
+    ok, buffer = cv2.imencode('.jpg', img_array, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image as JPEG")
+    return buffer.tobytes()
+
+# Helper function to encode an image as base64 JPEG (without data: header)
+def image_to_base64(img_array, quality: int = FACE_IMAGE_JPEG_QUALITY) -> str:
+    return base64.b64encode(image_to_jpeg(img_array, quality)).decode('ascii')
+
+# Helper function to decode a camera frame and bring it to detection size
+def decode_face_image(base64_string):
+    img = base64_to_image(base64_string)
+    if img is None:
+        return None
+    return downscale_image(img, FACE_IMAGE_MAX_SIDE)
+
+# Helper function to build the compact photo stored for a user: the face
+# with some margin (so it can be detected again), downscaled and recompressed
+def face_storage_image(img_array, box) -> str:
+    x, y, w, h = box
+    height, width = img_array.shape[:2]
+    margin_x = int(w * FACE_STORED_MARGIN)
+    margin_y = int(h * FACE_STORED_MARGIN)
+    left, top = max(0, x - margin_x), max(0, y - margin_y)
+    right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+    crop = img_array[top:bottom, left:right]
+    return image_to_base64(downscale_image(crop, FACE_STORED_MAX_SIDE))
+
+# Haar cascade cache: built once per worker thread instead of once per call
+_face_cascades = threading.local()
+
+def get_face_cascade():
+    face_cascade = getattr(_face_cascades, "cascade", None)
+    if face_cascade is None:
+        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        face_cascade = cv2.CascadeClassifier(cascade_path)
+        _face_cascades.cascade = face_cascade
+    return face_cascade
+
+class DetectedFace(NamedTuple):
+    crop: np.ndarray  # BGR uint8 face crop, ready for the embedding model
+    box: Tuple[int, int, int, int]  # x, y, w, h in the source image
+    confidence: float
+
+# Helper function to find the main face of an image (None if there is no face)
+def detect_face(img_array) -> Optional[DetectedFace]:
+    try:
+        extracted_faces = get_deepface().extract_faces(
+            img_path=img_array,
+            detector_backend=FACE_DETECTOR_BACKEND,
+            enforce_detection=False,
+            align=True,
+            color_face="bgr",
+            normalize_face=False,
+        )
+
+        best = None
+        for face in extracted_faces:
+            area = face.get("facial_area") or {}
+            confidence = float(face.get("confidence") or 0.0)
+            width = int(area.get("w") or 0)
+            height = int(area.get("h") or 0)
+
+            if confidence < FACE_MIN_CONFIDENCE or width < FACE_MIN_SIZE or height < FACE_MIN_SIZE:
+                continue
+            if best is None or width * height > best.box[2] * best.box[3]:
+                crop = np.clip(face["face"], 0, 255).astype(np.uint8)
+                best = DetectedFace(crop, (int(area.get("x") or 0), int(area.get("y") or 0), width, height), confidence)
+
+        if best is not None:
+            return best
+
+        # Fallback detector: tuned Haar cascade, more permissive on kiosk lighting
+        face_cascade = get_face_cascade()
+        if face_cascade.empty():
+            return None
+
+        gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
+        gray = cv2.equalizeHist(gray)
+        faces = face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=1.05,
+            minNeighbors=4,
+            minSize=(60, 60),
+        )
+        if len(faces) == 0:
+            return None
+
+        x, y, w, h = max(faces, key=lambda f: int(f[2]) * int(f[3]))
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        return DetectedFace(img_array[y:y + h, x:x + w].copy(), (x, y, w, h), 0.0)
+    except Exception as e:
+        logger.error(f"Error detecting face: {e}")
+        return None
+
+class PreparedFace(NamedTuple):
+    valid: bool  # False if the image could not be decoded
+    face: Optional[DetectedFace]
+    stored_image: Optional[str]  # compact base64 JPEG for the user document
+    timings: Tuple[Tuple[str, float], ...]  # (stage, seconds)
+
+# Decode and detect (and optionally build the stored photo) in one call, so a
+# worker process only sends back the small face crop, never the full frame.
+# Without a detected face, whole_image_fallback embeds the whole picture.
+def prepare_face(face_image: str, store: bool = False, whole_image_fallback: bool = False) -> PreparedFace:
+    timings = []
+
+    start = time.perf_counter()
+    img = decode_face_image(face_image)
+    timings.append(("decode", time.perf_counter() - start))
+    if img is None:
+        return PreparedFace(False, None, None, tuple(timings))
+
+    start = time.perf_counter()
+    face = detect_face(img)
+    timings.append(("detect", time.perf_counter() - start))
+    if face is None and whole_image_fallback:
+        height, width = img.shape[:2]
+        face = DetectedFace(img, (0, 0, width, height), 0.0)
+
+    stored_image = None
+    if store and face is not None:
+        start = time.perf_counter()
+        stored_image = face_storage_image(img, face.box)
+        timings.append(("encode", time.perf_counter() - start))
+
+    return PreparedFace(True, face, stored_image, tuple(timings))
+
+# Helper function to compute the Facenet embeddings of face crops from detect_face.
+# Several crops go through the model in one batched forward pass; stored and
+# query embeddings both come from here so they are always preprocessed alike.
+def compute_face_embeddings(face_crops) -> List[Optional[np.ndarray]]:
+    try:
+        # The crops are already detected and aligned, so DeepFace must not detect again
+        representations = get_deepface().represent(
+            img_path=list(face_crops) if len(face_crops) > 1 else face_crops[0],
+            model_name=FACE_MODEL_NAME,
+            detector_backend="skip",
+            enforce_detection=False,
+        )
+        # A single image gives one list of faces, a batch one list per image
+        if len(face_crops) == 1:
+            representations = [representations]
+        return [
+            np.asarray(faces[0]["embedding"], dtype=np.float32) if faces else None
+            for faces in representations
+        ]
+    except Exception as e:
+        if len(face_crops) == 1:
+            logger.error(f"Error computing face embedding: {e}")
+            return [None]
+        # Do not fail every caller because of one bad crop
+        logger.warning(f"Batched face embedding failed, retrying {len(face_crops)} crops one by one: {e}")
+        return [compute_face_embeddings([crop])[0] for crop in face_crops]
+
+def compute_face_embedding(face_crop) -> Optional[np.ndarray]:
+    return compute_face_embeddings([face_crop])[0]
+
+# Load Facenet and the detector and run one dummy inference so the first
+# visitor does not pay TensorFlow graph construction and weight loading
+def warm_up_face_models(batch_size: int = 1):
+    get_deepface().build_model(FACE_MODEL_NAME)
+    get_face_cascade()
+
+    dummy = np.full((160, 160, 3), 128, dtype=np.uint8)
+    detect_face(dummy)
+    compute_face_embedding(dummy)
+    if batch_size > 1:
+        compute_face_embeddings([dummy, dummy])
+    return True
@@ -0,0 +1,264 @@
+"""
+Shared face worker service.
+
+In "process" mode every API process starts its own FaceWorkerPool, so
+`uvicorn --workers K` loads the models K times per core and the admin
+restart/scale endpoints only reach the pool of the API worker that answered.
+This module runs one pool for all of them instead:
+
+    python face_service.py
+
+and the API processes, started with FACE_POOL_MODE=service, talk to it through
+FaceServiceClient, which has the same interface as FaceWorkerPool.
+
+The pool runs on an event loop thread of the service process; each client
+connection gets a thread that forwards its calls to it. Connections are
+authenticated with FACE_SERVICE_AUTHKEY before anything is unpickled, and the
+service refuses to start without it.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+from typing import Callable, List, Optional, Tuple, Union
+
+from face_worker import FaceWorkerError, FaceWorkerPool
+
+logger = logging.getLogger(__name__)
+
+FACE_SERVICE_METHODS = ("run", "wait_ready", "restart", "scale", "status")
+
+
+class FaceServiceUnavailable(FaceWorkerError):
+    pass
+
+
+def parse_address(address: str) -> Union[Tuple[str, int], str]:
+    """"host:port" for TCP, anything else is a Unix socket path."""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class FaceService:
+    """Blocking facade over a FaceWorkerPool running on its own event loop."""
+
+    def __init__(self, pool: FaceWorkerPool):
+        self._pool = pool
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="face-service-loop", daemon=True)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _start(self):
+        self._pool.start()
+
+    async def _scale(self, size: int):
+        await self._pool.scale(size)
+        return await self._status()
+
+    async def _status(self) -> dict:
+        return {
+            "size": self._pool.size,
+            "restarts": self._pool.restarts,
+            "error": self._pool.halted_error,
+            "load_error": self._pool.load_error,
+            "workers": self._pool.health(),
+        }
+
+    def start(self):
+        self._thread.start()
+        self._call(self._start())
+
+    def stop(self):
+        self._call(self._pool.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def run(self, fn: Callable, args: tuple):
+        return self._call(self._pool.run(fn, *args))
+
+    def wait_ready(self):
+        self._call(self._pool.wait_ready())
+
+    def restart(self):
+        self._call(self._pool.restart())
+
+    def scale(self, size: int) -> dict:
+        return self._call(self._scale(size))
+
+    def status(self) -> dict:
+        return self._call(self._status())
+
+    def serve(self, listener: Listener, authkey: bytes):
+        # The listener has no authkey: the handshake runs on the client's
+        # thread, so a slow client cannot hold up the others
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self._serve_client, args=(conn, authkey), name="face-service-client",
+                             daemon=True).start()
+
+    def _serve_client(self, conn, authkey: bytes):
+        with conn:
+            try:
+                deliver_challenge(conn, authkey)
+                answer_challenge(conn, authkey)
+            except (OSError, EOFError, AuthenticationError) as e:
+                logger.warning(f"Rejected face service connection: {type(e).__name__}: {e}")
+                return
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (OSError, EOFError):
+                    return
+                try:
+                    if method not in FACE_SERVICE_METHODS:
+                        raise FaceWorkerError(f"Unknown face service method {method}")
+                    reply = (True, getattr(self, method)(*args))
+                except FaceWorkerError as e:
+                    reply = (False, str(e))
+                except Exception as e:
+                    reply = (False, f"{type(e).__name__}: {e}")
+                conn.send(reply)
+
+
+class FaceServiceClient:
+    """FaceWorkerPool interface backed by the shared face service.
+
+    size, restarts, halted_error, load_error and health() come from a status
+    poll every status_interval seconds; calls block a thread of this client,
+    so threads bounds how many tasks one API process can have in flight.
+    """
+
+    def __init__(self, address: str, authkey: bytes, size: int, threads: int = 32,
+                 status_interval: float = 1.0):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.size = size
+        self.restarts = 0
+        self.halted_error: Optional[str] = None
+        self.load_error: Optional[str] = None
+        self.status_interval = status_interval
+        self._workers: List[dict] = []
+        # One connection per calling thread
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="face-service")
+        self._monitor = None
+
+    def _call(self, method: str, *args):
+        for _ in range(2):
+            conn = getattr(self._local, "conn", None)
+            fresh = conn is None
+            try:
+                if fresh:
+                    conn = self._local.conn = Client(self.address, authkey=self.authkey)
+                conn.send((method, args))
+                ok, value = conn.recv()
+                break
+            except AuthenticationError:
+                raise
+            except (OSError, EOFError) as e:
+                self._local.conn = None
+                if conn is not None:
+                    conn.close()
+                if fresh:
+                    raise FaceServiceUnavailable(f"Face service unavailable: {type(e).__name__}: {e}")
+                # Connection left over from before the service restarted: retry on a new one
+        if not ok:
+            raise FaceWorkerError(value)
+        return value
+
+    def _update(self, status: dict):
+        self.size = status["size"]
+        self.restarts = status["restarts"]
+        self.halted_error = status["error"]
+        self.load_error = status["load_error"]
+        self._workers = status["workers"]
+
+    async def refresh(self):
+        try:
+            self._update(await asyncio.to_thread(self._call, "status"))
+        except FaceServiceUnavailable as e:
+            self.halted_error = str(e)
+
+    async def _watch(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.status_interval)
+
+    def start(self):
+        """Start polling the service status; must be called from the running event loop."""
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in a worker of the service; fn must be importable by the workers."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, "run", fn, args)
+
+    async def wait_ready(self):
+        """Wait for the service to come up and its workers to load the models."""
+        while True:
+            try:
+                await asyncio.to_thread(self._call, "wait_ready")
+                break
+            except FaceServiceUnavailable:
+                await asyncio.sleep(self.status_interval)
+        await self.refresh()
+
+    async def restart(self):
+        try:
+            await asyncio.to_thread(self._call, "restart")
+        finally:
+            await self.refresh()
+
+    async def scale(self, size: int):
+        self._update(await asyncio.to_thread(self._call, "scale", size))
+
+    async def stop(self):
+        # The service itself keeps running for the other API processes
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        self._executor.shutdown(wait=False)
+
+    def health(self) -> List[dict]:
+        return self._workers
+
+
+def main():
+    # Imported here: face_pipeline loads .env, which the settings below may come from
+    from face_pipeline import warm_up_face_models
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - face-service - %(name)s - %(levelname)s - %(message)s'
+    )
+    authkey = os.environ.get('FACE_SERVICE_AUTHKEY')
+    if not authkey:
+        raise SystemExit("FACE_SERVICE_AUTHKEY must be set")
+    address = os.environ.get('FACE_SERVICE_ADDRESS', '127.0.0.1:8765')
+    pool = FaceWorkerPool(
+        int(os.environ.get('FACE_POOL_WORKERS', str(os.cpu_count() or 2))),
+        warm_up=functools.partial(warm_up_face_models, int(os.environ.get('FACE_EMBED_BATCH_SIZE', '8'))),
+        task_timeout=float(os.environ.get('FACE_WORKER_TASK_TIMEOUT', '120')),
+    )
+    service = FaceService(pool)
+    service.start()
+    listener = Listener(parse_address(address), backlog=128)
+    logger.info(f"Face service listening on {address} with {pool.size} workers")
+    try:
+        service.serve(listener, authkey.encode())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Face recognition worker processes.
+
+Each worker is a separate process with its own DeepFace/TensorFlow models,
+fed through its own task queue; results come back on one shared queue read
+by a thread of the API process, so the API process never loads TensorFlow.
+
+Tasks go to the least busy ready worker. A worker that dies or stops
+answering is replaced, workers can be restarted one at a time without losing
+capacity, and the pool can be resized while running.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FaceWorkerError(RuntimeError):
+    pass
+
+
+def _worker_main(worker_id: int, tasks, results, warm_up: Optional[Callable]):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - face-worker-{worker_id} - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        if warm_up is not None:
+            warm_up()
+    except Exception as e:
+        results.put(("failed", worker_id, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", worker_id))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, fn, args = task
+        try:
+            results.put(("result", worker_id, task_id, True, fn(*args)))
+        except Exception as e:
+            results.put(("result", worker_id, task_id, False, f"{type(e).__name__}: {e}"))
+
+
+class FaceWorker:
+
+    def __init__(self, worker_id: int, process, tasks):
+        self.id = worker_id
+        self.process = process
+        self.tasks = tasks
+        self.ready = False
+        self.draining = False
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.completed = 0
+        self.failed = 0
+        self.last_task_seconds = 0.0
+        self.inflight: Dict[int, asyncio.Future] = {}
+        self.submitted_at: Dict[int, float] = {}
+
+    def health(self) -> dict:
+        return {
+            "id": self.id,
+            "pid": self.process.pid,
+            "alive": self.process.is_alive(),
+            "ready": self.ready,
+            "draining": self.draining,
+            "error": self.error,
+            "inflight": len(self.inflight),
+            "completed": self.completed,
+            "failed": self.failed,
+            "last_task_ms": round(self.last_task_seconds * 1000, 2),
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+
+class FaceWorkerPool:
+
+    def __init__(self, size: int, warm_up: Optional[Callable] = None, task_timeout: float = 120.0,
+                 check_interval: float = 1.0, start_method: str = "spawn"):
+        self.size = max(1, size)
+        self.warm_up = warm_up
+        self.task_timeout = task_timeout
+        self.check_interval = check_interval
+        self.restarts = 0
+        # Last model load failure. The failed worker is removed and not
+        # respawned automatically until restart() or scale(); the others keep
+        # serving.
+        self.load_error: Optional[str] = None
+        self._context = multiprocessing.get_context(start_method)
+        self._results = None
+        self._workers: Dict[int, FaceWorker] = {}
+        self._worker_ids = itertools.count(1)
+        self._task_ids = itertools.count(1)
+        self._loop = None
+        self._reader = None
+        self._monitor = None
+
+    @property
+    def workers(self) -> List[FaceWorker]:
+        return list(self._workers.values())
+
+    def _active(self) -> List[FaceWorker]:
+        return [w for w in self._workers.values() if not w.draining]
+
+    def _ready(self) -> List[FaceWorker]:
+        return [w for w in self._active() if w.ready and w.error is None and w.process.is_alive()]
+
+    def _starting(self) -> List[FaceWorker]:
+        return [w for w in self._active() if not w.ready and w.error is None and w.process.is_alive()]
+
+    @property
+    def halted_error(self) -> Optional[str]:
+        """Why the pool cannot serve: the models failed to load and no worker
+        is ready or still loading them."""
+        if self.load_error is not None and not self._ready() and not self._starting():
+            return self.load_error
+        return None
+
+    def start(self):
+        """Spawn the workers; must be called from the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._results = self._context.Queue()
+        self._reader = threading.Thread(target=self._read_results, name="face-worker-results", daemon=True)
+        self._reader.start()
+        for _ in range(self.size):
+            self._spawn()
+        self._monitor = asyncio.create_task(self._watch())
+
+    def _spawn(self) -> FaceWorker:
+        worker_id = next(self._worker_ids)
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, tasks, self._results, self.warm_up),
+            name=f"face-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        worker = FaceWorker(worker_id, process, tasks)
+        self._workers[worker_id] = worker
+        logger.info(f"Started face worker {worker_id} (pid {process.pid})")
+        return worker
+
+    def _read_results(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            self._loop.call_soon_threadsafe(self._handle, message)
+
+    def _handle(self, message):
+        kind, worker_id = message[0], message[1]
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            return
+        if kind == "ready":
+            worker.ready = True
+            logger.info(f"Face worker {worker_id} ready")
+        elif kind == "failed":
+            # The worker exits by itself; _watch reaps it
+            worker.error = message[2]
+            self.load_error = message[2]
+            logger.error(f"Face worker {worker_id} could not load the models: {message[2]}")
+        elif kind == "result":
+            _, _, task_id, ok, value = message
+            future = worker.inflight.pop(task_id, None)
+            submitted_at = worker.submitted_at.pop(task_id, None)
+            if submitted_at is not None:
+                worker.last_task_seconds = time.monotonic() - submitted_at
+            if ok:
+                worker.completed += 1
+            else:
+                worker.failed += 1
+            if future is None or future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(FaceWorkerError(value))
+
+    def _pick(self) -> Optional[FaceWorker]:
+        candidates = self._ready()
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: len(w.inflight))
+
+    async def _ready_worker(self) -> FaceWorker:
+        # Tasks only go to workers that finished loading the models, so the
+        # task timeout never includes warm-up (e.g. while a worker is replaced)
+        while True:
+            if self.halted_error is not None:
+                raise FaceWorkerError(self.halted_error)
+            worker = self._pick()
+            if worker is not None:
+                return worker
+            await asyncio.sleep(0.1)
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in a worker; fn must be importable by the workers."""
+        worker = await self._ready_worker()
+        task_id = next(self._task_ids)
+        future = self._loop.create_future()
+        worker.inflight[task_id] = future
+        worker.submitted_at[task_id] = time.monotonic()
+        worker.tasks.put((task_id, fn, args))
+        try:
+            # Shielded: a cancelled request leaves the task accounted until it finishes
+            return await asyncio.wait_for(asyncio.shield(future), self.task_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Face worker {worker.id} did not answer in {self.task_timeout}s, killing it")
+            worker.inflight.pop(task_id, None)
+            future.cancel()
+            worker.process.kill()
+            raise FaceWorkerError(f"Face worker {worker.id} timed out")
+
+    async def wait_ready(self):
+        """Wait until no worker is still loading the models; raises if then
+        none of them is ready."""
+        while True:
+            if not self._starting():
+                if self._ready():
+                    return
+                if self.load_error is not None:
+                    raise FaceWorkerError(self.load_error)
+            await asyncio.sleep(0.1)
+
+    def _drain(self, worker: FaceWorker):
+        # The worker finishes what is already queued for it, then exits
+        worker.draining = True
+        worker.tasks.put(None)
+
+    def _reap(self, worker: FaceWorker):
+        del self._workers[worker.id]
+        worker.process.join(timeout=0)
+        for future in worker.inflight.values():
+            if not future.done():
+                future.set_exception(FaceWorkerError(f"Face worker {worker.id} exited"))
+        worker.tasks.close()
+        worker.tasks.cancel_join_thread()
+        if worker.draining:
+            logger.info(f"Face worker {worker.id} stopped")
+        elif worker.error is not None:
+            logger.warning(f"Face worker {worker.id} removed after failing to load the models")
+        else:
+            self.restarts += 1
+            logger.warning(f"Face worker {worker.id} exited unexpectedly (exit code {worker.process.exitcode})")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for worker in self.workers:
+                if not worker.process.is_alive():
+                    self._reap(worker)
+            # Respawning after a load failure would most likely fail again
+            if self.load_error is None:
+                for _ in range(self.size - len(self._active())):
+                    self._spawn()
+
+    async def restart(self):
+        """Replace every worker, one at a time, starting each replacement
+        before draining the worker it replaces. If a replacement cannot load
+        the models, the worker it was meant to replace keeps running."""
+        self.load_error = None
+        active = self._active()
+        if not active:
+            # Nothing to replace (e.g. every worker exited after failing to load the models)
+            for _ in range(self.size):
+                self._spawn()
+            await self.wait_ready()
+            return
+        for old in active:
+            new = self._spawn()
+            while not new.ready:
+                if new.error is not None or not new.process.is_alive():
+                    raise FaceWorkerError(f"Replacement face worker failed to start: {new.error or 'exited'}")
+                await asyncio.sleep(0.1)
+            self._drain(old)
+
+    async def scale(self, size: int):
+        """Change the number of workers; extra workers are drained, not killed."""
+        self.size = max(1, size)
+        self.load_error = None
+        active = self._active()
+        for _ in range(self.size - len(active)):
+            self._spawn()
+        for worker in sorted(active, key=lambda w: len(w.inflight))[:max(0, len(active) - self.size)]:
+            self._drain(worker)
+
+    async def stop(self, timeout: float = 10.0):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for worker in self._active():
+            self._drain(worker)
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            await asyncio.to_thread(worker.process.join, max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+            self._reap(worker)
+        if self._results is not None:
+            self._results.put(None)
+
+    def health(self) -> List[dict]:
+        return [worker.health() for worker in self.workers]
@@ -0,0 +1,95 @@
+"""
+Idempotency-Key handling.
+
+A handler runs at most once per key: concurrent retries wait for the attempt
+in flight, later ones get the stored response replayed. Only successful
+responses are stored, so a retry after an error runs again.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Tuple
+
+
+class IdempotencyKeyReused(ValueError):
+    pass
+
+
+class IdempotencyCache:
+    """TTL'd LRU of successful responses, optionally backed by a Mongo collection
+    so replays also work across API workers and restarts."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self._entries = OrderedDict()  # key -> (expires_at, fingerprint, body)
+        self.inflight = {}  # key -> asyncio.Future of the attempt still running
+
+    async def ensure_indexes(self):
+        if self.collection is not None:
+            await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1], entry[2]
+            del self._entries[key]
+
+        if self.collection is not None:
+            doc = await self.collection.find_one({"_id": key})
+            if doc:
+                self._remember(key, doc['fingerprint'], doc['body'])
+                return doc['fingerprint'], doc['body']
+        return None
+
+    def _remember(self, key: str, fingerprint: str, body):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, fingerprint, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def put(self, key: str, fingerprint: str, body):
+        self._remember(key, fingerprint, body)
+        if self.collection is not None:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"fingerprint": fingerprint, "body": body, "created_at": datetime.utcnow()},
+                upsert=True
+            )
+
+    async def clear(self):
+        self._entries.clear()
+        if self.collection is not None:
+            await self.collection.delete_many({})
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable]) -> Tuple[bool, object]:
+        """Return (replayed, body); raise IdempotencyKeyReused if the key was
+        stored for a request with another fingerprint."""
+        # Same key still running: wait for that attempt, then check again, since
+        # another retry may have claimed the key in between
+        while key in self.inflight:
+            await asyncio.shield(self.inflight[key])
+
+        # Claimed before any await, so concurrent retries wait for this attempt
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            cached = await self.get(key)
+            if cached is not None:
+                cached_fingerprint, body = cached
+                if cached_fingerprint != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                return True, body
+
+            body = await handler()
+            await self.put(key, fingerprint, body)
+            return False, body
+        finally:
+            # Wake up concurrent retries; they re-read the cache (empty if this attempt failed)
+            future.set_result(True)
+            self.inflight.pop(key, None)
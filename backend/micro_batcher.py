@@ -0,0 +1,65 @@
+"""
+Micro-batching of concurrent calls to a batched function.
+
+Items submitted within max_wait seconds of each other (up to max_batch) are
+handed to the batch callback together and every caller gets its own result
+back. Several batches may run at the same time.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+
+
+class MicroBatcher:
+
+    def __init__(self, run_batch: Callable[[list], Awaitable[list]],
+                 max_batch: int = 8, max_wait: float = 0.005):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._pending: List[Tuple[object, asyncio.Future]] = []
+        self._timer = None
+        self._running = set()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending[:self.max_batch]
+        del self._pending[:len(batch)]
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+
+    async def _run(self, batch: List[Tuple[object, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch of {len(batch)} items returned {len(results)} results")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The caller may have given up (request cancelled) meanwhile
+            if not future.done():
+                future.set_result(result)
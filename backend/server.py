@@ -1,5 +1,6 @@
-﻿from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile
-from fastapi.responses import JSONResponse
+﻿from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,19 +8,45 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import uuid
-from datetime import datetime
-from deepface import DeepFace
-import base64
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import numpy as np
-import cv2
-import io
-from PIL import Image as PILImage
-import tempfile
 from bson import ObjectId
 import json
 import bcrypt
+import asyncio
+import time
+import hashlib
+import secrets
+import random
+import zlib
+import functools
+from collections import Counter
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from face_index import create_face_index, index_fingerprint, write_index_file
+from vote_batches import store_vote_batch
+from vote_queue import VoteQueue
+from micro_batcher import MicroBatcher
+from face_pipeline import (
+    FACE_EMBEDDING_VERSION,
+    FACE_MODEL_NAME,
+    PreparedFace,
+    base64_to_image,
+    compute_face_embeddings,
+    downscale_image,
+    image_to_jpeg,
+    prepare_face,
+    warm_up_face_models,
+)
+from face_service import FaceServiceClient
+from face_worker import FaceWorkerError, FaceWorkerPool
+from idempotency import IdempotencyCache, IdempotencyKeyReused
+from session_token import InvalidSessionToken, sign_session_token, verify_session_token
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -29,6 +56,14 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Cursors are streamed in batches so memory and correctness never depend on
+# collection size
+MONGO_BATCH_SIZE = int(os.environ.get('MONGO_BATCH_SIZE', '500'))
+
+async def stream_cursor(cursor, batch_size: int = MONGO_BATCH_SIZE):
+    async for doc in cursor.batch_size(batch_size):
+        yield doc
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -48,6 +83,164 @@ def serialize_doc(doc):
         doc['_id'] = str(doc['_id'])
     return doc
 
+# Lightweight user representation for identity and vote checks.
+# Hot paths must never load face_image/face_embedding blobs.
+USUARIO_RESUMO_PROJECTION = {"nome": 1, "cpf": 1, "telefone": 1, "ja_votou": 1}
+
+def usuario_resumo(doc) -> dict:
+    return {
+        "id": str(doc['_id']),
+        "nome": doc['nome'],
+        "cpf": doc['cpf'],
+        "telefone": doc['telefone'],
+        "ja_votou": doc.get('ja_votou', False)
+    }
+
+# Face worker pool
+# DeepFace/OpenCV/PIL work is CPU bound and must not run on the event loop,
+# otherwise one kiosk's face check blocks every other request.
+# In "process" mode it runs in FACE_POOL_WORKERS worker processes, each with
+# its own models (face_worker.py), and TensorFlow is never loaded by the API
+# process; "thread" mode keeps everything in-process (development).
+# Both start a pool per API process, so they are for a single API worker.
+# With several (`uvicorn --workers K`) use "service" mode: one face_service.py
+# process runs the pool for all of them, and the admin endpoints act on it.
+FACE_POOL_MODE = os.environ.get('FACE_POOL_MODE', 'process')
+FACE_POOL_WORKERS = int(os.environ.get('FACE_POOL_WORKERS', str(os.cpu_count() or 2)))
+FACE_POOL_MAX_QUEUE = int(os.environ.get('FACE_POOL_MAX_QUEUE', '8'))
+FACE_POOL_RETRY_AFTER = int(os.environ.get('FACE_POOL_RETRY_AFTER', '2'))
+FACE_WORKER_TASK_TIMEOUT = float(os.environ.get('FACE_WORKER_TASK_TIMEOUT', '120'))
+FACE_SERVICE_ADDRESS = os.environ.get('FACE_SERVICE_ADDRESS', '127.0.0.1:8765')
+
+# Micro-batching of embedding requests
+# Crops from concurrent requests arriving within FACE_EMBED_BATCH_WAIT_MS are
+# embedded together (up to FACE_EMBED_BATCH_SIZE); on CPU one batched Facenet
+# call is much cheaper than the same number of single-image calls.
+FACE_EMBED_BATCH_SIZE = int(os.environ.get('FACE_EMBED_BATCH_SIZE', '8'))
+FACE_EMBED_BATCH_WAIT_MS = float(os.environ.get('FACE_EMBED_BATCH_WAIT_MS', '5'))
+
+if FACE_POOL_MODE == 'process':
+    face_workers = FaceWorkerPool(
+        FACE_POOL_WORKERS,
+        warm_up=functools.partial(warm_up_face_models, FACE_EMBED_BATCH_SIZE),
+        task_timeout=FACE_WORKER_TASK_TIMEOUT,
+    )
+    face_executor = None
+elif FACE_POOL_MODE == 'service':
+    # Size is the service's, refreshed once connected; each API process
+    # keeps up to workers + queue face tasks in flight (admission control)
+    face_workers = FaceServiceClient(
+        FACE_SERVICE_ADDRESS,
+        os.environ['FACE_SERVICE_AUTHKEY'].encode(),
+        size=FACE_POOL_WORKERS,
+        threads=FACE_POOL_WORKERS + FACE_POOL_MAX_QUEUE,
+    )
+    face_executor = None
+else:
+    face_workers = None
+    face_executor = ThreadPoolExecutor(max_workers=FACE_POOL_WORKERS, thread_name_prefix="face")
+
+# Number of workers currently serving face requests
+def face_pool_size() -> int:
+    return face_workers.size if face_workers is not None else FACE_POOL_WORKERS
+
+face_pool_active = 0
+face_pool_rejected = 0
+face_models_ready = False
+face_models_error: Optional[str] = None
+
+# Face models are usable: warmed up, and no worker stuck failing to load them
+def face_models_available() -> bool:
+    return face_models_ready and (face_workers is None or face_workers.halted_error is None)
+
+# Wait for the face models (possibly until an admin restarts the workers)
+async def wait_face_models_available():
+    while not face_models_available():
+        await asyncio.sleep(1)
+
+# Aggregated per-stage timings: stage -> {"count", "total", "max"} (seconds)
+stage_stats = {}
+
+def record_stage_timing(stage: str, elapsed: float):
+    stats = stage_stats.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+    stats["count"] += 1
+    stats["total"] += elapsed
+    stats["max"] = max(stats["max"], elapsed)
+
+class StageTimer:
+    """Collects the duration of each stage of a single request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = []
+
+    def add(self, stage: str, elapsed: float):
+        self.timings.append((stage, elapsed))
+        record_stage_timing(f"{self.name}.{stage}", elapsed)
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def summary(self) -> str:
+        return " ".join(f"{stage}={elapsed * 1000:.1f}ms" for stage, elapsed in self.timings)
+
+# Admission control: at most workers + queue requests may use the pool at once
+@asynccontextmanager
+async def face_pool_admission():
+    global face_pool_active, face_pool_rejected
+    if not face_models_available():
+        raise HTTPException(
+            status_code=503,
+            detail="Reconhecimento facial ainda carregando. Tente novamente em instantes.",
+            headers={"Retry-After": str(FACE_POOL_RETRY_AFTER)},
+        )
+    if face_pool_active >= face_pool_size() + FACE_POOL_MAX_QUEUE:
+        face_pool_rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": str(FACE_POOL_RETRY_AFTER)},
+        )
+    face_pool_active += 1
+    try:
+        yield
+    finally:
+        face_pool_active -= 1
+
+# Run a CPU-bound function in the face pool, timing it as a request stage.
+# In process mode fn must be importable by the workers (face_pipeline).
+async def run_in_face_pool(timer: Optional[StageTimer], stage: str, fn, *args):
+    start = time.perf_counter()
+    try:
+        if face_workers is not None:
+            return await face_workers.run(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(face_executor, fn, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        if timer is not None:
+            timer.add(stage, elapsed)
+        else:
+            record_stage_timing(stage, elapsed)
+
+# Decode and detect a face image in the pool, recording the stages timed by the worker
+async def run_prepare_face(timer: StageTimer, face_image: str, store: bool = False,
+                           whole_image_fallback: bool = False) -> PreparedFace:
+    prepared = await run_in_face_pool(timer, "prepare", prepare_face, face_image, store, whole_image_fallback)
+    for stage, elapsed in prepared.timings:
+        timer.add(stage, elapsed)
+    return prepared
+
+embedding_batcher = MicroBatcher(
+    lambda crops: run_in_face_pool(None, "embed.batch", compute_face_embeddings, crops),
+    max_batch=FACE_EMBED_BATCH_SIZE,
+    max_wait=FACE_EMBED_BATCH_WAIT_MS / 1000.0,
+)
+
 # Models
 class Usuario(BaseModel):
     nome: str
@@ -78,7 +271,7 @@ class TurmaCreate(BaseModel):
     nome_turma: str
     nome_projeto: str
     numero_barraca: str
-    foto_base64: str
+    foto_base64: Optional[str] = None  # optional on update: keeps the current photo
 
 class Voto(BaseModel):
     usuario_id: str
@@ -91,74 +284,200 @@ class FaceVerifyRequest(BaseModel):
 class VoteRequest(BaseModel):
     usuario_id: str
     turma_id: str
+    session_token: Optional[str] = None
 
 class AdminLoginRequest(BaseModel):
     password: str
 
+class FaceWorkersScaleRequest(BaseModel):
+    workers: int
+
 class AdminChangePasswordRequest(BaseModel):
     current_password: str
     new_password: str
 
-# Helper function to decode base64 image
-def base64_to_image(base64_string):
-    try:
-        # Remove header if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        img_data = base64.b64decode(base64_string)
-        img = PILImage.open(io.BytesIO(img_data))
-        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    except Exception as e:
-        logger.error(f"Error decoding base64 image: {e}")
+# Keep the original camera frame of each registration (outside usuarios)
+FACE_ARCHIVE_ORIGINALS = os.environ.get('FACE_ARCHIVE_ORIGINALS', 'false').lower() in ('1', 'true', 'yes')
+
+# DeepFace default threshold for Facenet + cosine distance
+FACENET_COSINE_THRESHOLD = 0.40
+
+# Helper function to build the embedding fields stored on a user document
+def embedding_to_doc(embedding: np.ndarray) -> dict:
+    return {
+        "face_embedding": embedding.astype("<f4").tobytes(),
+        "face_embedding_model": FACE_MODEL_NAME,
+        "face_embedding_version": FACE_EMBEDDING_VERSION,
+        # Lets the other API workers pick the embedding up (refresh_face_index)
+        "face_embedding_at": datetime.utcnow(),
+    }
+
+# Helper function to read the stored embedding of a user (None if missing or stale)
+def embedding_from_doc(doc) -> Optional[np.ndarray]:
+    data = doc.get("face_embedding")
+    if not data:
         return None
+    if doc.get("face_embedding_model") != FACE_MODEL_NAME:
+        return None
+    if doc.get("face_embedding_version") != FACE_EMBEDDING_VERSION:
+        return None
+    return np.frombuffer(bytes(data), dtype="<f4")
 
-# Helper function to save temp image
-def save_temp_image(img_array):
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-    cv2.imwrite(temp_file.name, img_array)
-    return temp_file.name
+# Compute and store the embedding of users registered before embeddings existed
+async def backfill_user_embedding(usuario) -> Optional[np.ndarray]:
+    # Legacy photos were stored without a detection check; embed the whole picture if needed
+    prepared = await run_prepare_face(StageTimer("backfill"), usuario.get('face_image', ''), whole_image_fallback=True)
+    if not prepared.valid:
+        return None
 
-# Helper function to check if an image contains at least one detectable face
-def has_detectable_face(img_array, image_path: str) -> bool:
-    try:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
-        gray = cv2.equalizeHist(gray)
-
-        cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-
-        if not face_cascade.empty():
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.05,
-                minNeighbors=4,
-                minSize=(60, 60),
-            )
-            if len(faces) > 0:
-                return True
-
-        # Fallback detector: less strict than enforce_detection=True
-        extracted_faces = DeepFace.extract_faces(
-            img_path=image_path,
-            detector_backend="opencv",
-            enforce_detection=False,
-            align=True,
-        )
+    embedding = await embedding_batcher.submit(prepared.face.crop)
+    if embedding is None:
+        return None
+
+    await db.usuarios.update_one(
+        {"_id": usuario['_id']},
+        {"$set": embedding_to_doc(embedding)}
+    )
+    logger.info(f"Stored face embedding for legacy user {usuario.get('nome', 'unknown')}")
+    return embedding
 
-        for face in extracted_faces:
-            area = face.get("facial_area") or {}
-            confidence = float(face.get("confidence") or 0.0)
-            width = int(area.get("w") or 0)
-            height = int(area.get("h") or 0)
+# Face identification index (exact brute force or IVF approximate search)
+FACE_INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'exact')
+FACE_INDEX_PATH = os.environ.get('FACE_INDEX_PATH', str(ROOT_DIR / 'face_index.npz'))
+FACE_INDEX_SAVE_INTERVAL = float(os.environ.get('FACE_INDEX_SAVE_INTERVAL', '60'))
+FACE_INDEX_REFRESH_INTERVAL = float(os.environ.get('FACE_INDEX_REFRESH_INTERVAL', '5'))
+# Embeddings written shortly before the previous refresh are read again, so
+# one stamped before that refresh but inserted after it is not missed
+FACE_INDEX_REFRESH_OVERLAP = timedelta(seconds=30)
 
-            if confidence >= 0.20 and width >= 40 and height >= 40:
-                return True
+if FACE_INDEX_BACKEND == 'ivf':
+    face_index = create_face_index(
+        'ivf',
+        n_lists=int(os.environ.get('FACE_INDEX_IVF_LISTS', '256')),
+        nprobe=int(os.environ.get('FACE_INDEX_IVF_NPROBE', '8')),
+    )
+else:
+    face_index = create_face_index(FACE_INDEX_BACKEND)
 
-        return False
+face_index_dirty = False
+# When the index last read the stored embeddings
+face_index_synced_at = datetime.utcnow()
+
+# Fingerprint of the stored embeddings, in the same form as the one the index
+# file records for its own content, used to tell if the file is current
+async def stored_embeddings_fingerprint() -> str:
+    query = {"face_embedding_version": FACE_EMBEDDING_VERSION}
+    total = await db.usuarios.count_documents(query)
+    last = await db.usuarios.find_one(query, {"_id": 1}, sort=[("_id", -1)])
+    return index_fingerprint(total, str(last['_id']) if last else '')
+
+def mark_face_index_dirty():
+    global face_index_dirty
+    face_index_dirty = True
+
+# Snapshot the index on the event loop and write it to disk in a thread
+async def save_face_index():
+    global face_index_dirty
+    # Cleared first: changes made while the file is written mark it dirty again
+    face_index_dirty = False
+    try:
+        await asyncio.to_thread(write_index_file, FACE_INDEX_PATH, face_index.snapshot())
     except Exception as e:
-        logger.error(f"Error detecting face presence: {e}")
-        return False
+        face_index_dirty = True
+        logger.error(f"Error saving face index: {e}")
+
+# Rebuild the in-memory index from every stored embedding
+FACE_EMBEDDING_PROJECTION = {"face_embedding": 1, "face_embedding_model": 1, "face_embedding_version": 1, "nome": 1}
+
+async def rebuild_face_index():
+    face_index.clear()
+    current = {"face_embedding_version": FACE_EMBEDDING_VERSION}
+    async for usuario in stream_cursor(db.usuarios.find(current, FACE_EMBEDDING_PROJECTION)):
+        embedding = embedding_from_doc(usuario)
+        if embedding is not None:
+            face_index.add(str(usuario['_id']), embedding)
+
+    logger.info(f"Face index rebuilt with {len(face_index)} embeddings")
+
+# Load the index from disk when it matches the stored embeddings, otherwise rebuild it
+async def load_face_index():
+    global face_index_synced_at
+    face_index_synced_at = datetime.utcnow()
+    if os.path.exists(FACE_INDEX_PATH):
+        try:
+            fingerprint = await stored_embeddings_fingerprint()
+            if face_index.load(FACE_INDEX_PATH) == fingerprint:
+                logger.info(f"Face index loaded from {FACE_INDEX_PATH} with {len(face_index)} embeddings")
+                return
+            logger.info("Face index file is out of date, rebuilding")
+        except Exception as e:
+            logger.error(f"Error loading face index file: {e}")
+
+    await rebuild_face_index()
+    await save_face_index()
+
+# Users registered before embeddings were stored (or with stale ones) are
+# embedded in the background once the face models are loaded; each one joins
+# the index as soon as it is done
+async def backfill_face_index():
+    legacy = {"face_embedding_version": {"$ne": FACE_EMBEDDING_VERSION}}
+    backfilled = 0
+    await wait_face_models_available()
+    async for usuario in stream_cursor(db.usuarios.find(legacy, {"nome": 1, "face_image": 1})):
+        await wait_face_models_available()
+        try:
+            embedding = await backfill_user_embedding(usuario)
+        except Exception as e:
+            logger.error(f"Error backfilling face embedding of user {usuario['_id']}: {e}")
+            continue
+        if embedding is not None:
+            face_index.add(str(usuario['_id']), embedding)
+            mark_face_index_dirty()
+            backfilled += 1
+
+    if backfilled:
+        logger.info(f"Backfilled face embeddings of {backfilled} legacy users")
+
+# Every API worker keeps its own index: pick up the embeddings stored by the
+# others (registrations and backfills), and start over after users were
+# deleted (reset-all)
+async def refresh_face_index():
+    global face_index_synced_at
+    if await db.usuarios.estimated_document_count() < len(face_index):
+        logger.info("Users were deleted, rebuilding the face index")
+        face_index_synced_at = datetime.utcnow()
+        await rebuild_face_index()
+        mark_face_index_dirty()
+        return
+
+    since = face_index_synced_at - FACE_INDEX_REFRESH_OVERLAP
+    face_index_synced_at = datetime.utcnow()
+    query = {"face_embedding_version": FACE_EMBEDDING_VERSION, "face_embedding_at": {"$gte": since}}
+    added = 0
+    async for usuario in stream_cursor(db.usuarios.find(query, FACE_EMBEDDING_PROJECTION)):
+        embedding = embedding_from_doc(usuario)
+        if embedding is not None:
+            user_id = str(usuario['_id'])
+            added += user_id not in face_index
+            face_index.add(user_id, embedding)
+    if added:
+        mark_face_index_dirty()
+        logger.info(f"Added {added} embeddings stored by other workers to the face index")
+
+async def face_index_refresher():
+    while True:
+        await asyncio.sleep(FACE_INDEX_REFRESH_INTERVAL)
+        try:
+            await refresh_face_index()
+        except Exception as e:
+            logger.error(f"Error refreshing face index: {e}")
+
+# Persist the index periodically so restarts do not rebuild from scratch
+async def face_index_saver():
+    while True:
+        await asyncio.sleep(FACE_INDEX_SAVE_INTERVAL)
+        if face_index_dirty:
+            await save_face_index()
 
 
 # Helper function to hash password
@@ -184,6 +503,66 @@ async def initialize_admin_password():
         })
         logger.info("Admin password initialized with default value")
 
+# Verified voting sessions
+# verify-face and register hand out a short-lived token signed with a secret
+# kept in admin_config (shared by every API worker). /api/vote trusts the
+# user id it carries instead of re-reading usuarios, and refuses ballots for
+# users that never proved their face. Whether they already voted is always
+# checked against usuarios, when the vote is recorded.
+VERIFIED_SESSION_TTL_SECONDS = int(os.environ.get('VERIFIED_SESSION_TTL_SECONDS', '600'))
+VOTE_REQUIRE_SESSION = os.environ.get('VOTE_REQUIRE_SESSION', 'true').lower() in ('1', 'true', 'yes')
+session_secret: Optional[bytes] = None
+
+async def initialize_session_secret():
+    global session_secret
+    await db.admin_config.update_one(
+        {"type": "session_secret"},
+        {"$setOnInsert": {"secret": secrets.token_hex(32), "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+    # Oldest first, in case two workers raced the upsert
+    config = await db.admin_config.find({"type": "session_secret"}).sort("_id", 1).limit(1).to_list(1)
+    session_secret = config[0]['secret'].encode('utf-8')
+
+def issue_session_token(usuario_id: str) -> str:
+    return sign_session_token(session_secret, usuario_id, VERIFIED_SESSION_TTL_SECONDS)
+
+def read_session_token(token: str) -> dict:
+    try:
+        return verify_session_token(session_secret, token)
+    except InvalidSessionToken:
+        raise HTTPException(status_code=401, detail="Sessao de votacao invalida ou expirada. Identifique-se novamente.")
+
+# Indexes required by the hot paths: (collection, keys, options)
+REQUIRED_INDEXES = [
+    ("usuarios", [("cpf", 1)], {"name": "cpf_unique", "unique": True}),
+    ("usuarios", [("face_embedding_version", 1)], {"name": "face_embedding_version"}),
+    ("usuarios", [("face_embedding_at", 1)], {"name": "face_embedding_at"}),
+    ("votos", [("timestamp", 1)], {"name": "timestamp"}),
+    # Also guarantees at most one ballot per user
+    ("votos", [("usuario_id", 1)], {"name": "usuario_id_unique", "unique": True}),
+    ("turma_contadores", [("turma_id", 1)], {"name": "turma_id"}),
+    ("votos_rollup", [("tipo", 1), ("inicio", 1)], {"name": "tipo_inicio"}),
+]
+
+# Create missing indexes on startup
+async def ensure_indexes():
+    for collection, keys, options in REQUIRED_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            # e.g. duplicate CPFs registered before the unique index existed
+            logger.error(f"Error creating index {collection}.{options['name']}: {e}")
+
+# Names of required indexes that do not exist
+async def get_missing_indexes() -> List[str]:
+    missing = []
+    for collection, keys, options in REQUIRED_INDEXES:
+        existing = await db[collection].index_information()
+        if not any(info.get('key') == keys for info in existing.values()):
+            missing.append(f"{collection}.{options['name']}")
+    return missing
+
 # Admin login endpoint
 @api_router.post("/admin/login")
 async def admin_login(request: AdminLoginRequest):
@@ -250,79 +629,54 @@ async def admin_change_password(request: AdminChangePasswordRequest):
 async def verify_face(request: FaceVerifyRequest):
     try:
         logger.info("Starting face verification...")
+        timer = StageTimer("verify_face")
         
-        # Decode the incoming face image
-        query_img = base64_to_image(request.face_image)
-        if query_img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-
-        # Save query image temporarily
-        query_path = save_temp_image(query_img)
-        # If no face is detected, user must retry capture.
-        if not has_detectable_face(query_img, query_path):
-            os.unlink(query_path)
-            raise HTTPException(
-                status_code=400,
-                detail="Nenhum rosto detectado. Posicione seu rosto na moldura e tente novamente.",
-            )
+        async with face_pool_admission():
+            # Decode the incoming face image and detect the face
+            prepared = await run_prepare_face(timer, request.face_image)
+            if not prepared.valid:
+                raise HTTPException(status_code=400, detail="Invalid image format")
 
-        # Get all users from database
-        usuarios = await db.usuarios.find().to_list(1000)
-        
-        if not usuarios:
+            # If no face is detected, user must retry capture.
+            face = prepared.face
+            if face is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Nenhum rosto detectado. Posicione seu rosto na moldura e tente novamente.",
+                )
+
+            # Compute the query embedding once, from the detected crop
+            with timer.stage("embed"):
+                query_embedding = await embedding_batcher.submit(face.crop)
+
+        if query_embedding is None:
+            raise HTTPException(status_code=400, detail="Nao foi possivel processar o rosto. Tente novamente.")
+
+        if len(face_index) == 0:
             logger.info("No users in database")
-            os.unlink(query_path)
             return {"found": False, "message": "Nenhum usuÃ¡rio cadastrado"}
-        
-        # Compare with each user's face
+
+        # Nearest registered embedding
         best_match = None
-        best_distance = float('inf')
-        
-        for usuario in usuarios:
-            try:
-                # Decode stored face image
-                stored_img = base64_to_image(usuario['face_image'])
-                if stored_img is None:
-                    continue
-                
-                stored_path = save_temp_image(stored_img)
-                
-                # Verify faces using DeepFace with balanced settings
-                result = DeepFace.verify(
-                    img1_path=query_path,
-                    img2_path=stored_path,
-                    model_name="Facenet",
-                    detector_backend="opencv",
-                    enforce_detection=False,  # Don't force detection to avoid errors
-                    distance_metric="cosine"
-                )
-                
-                os.unlink(stored_path)
-                
-                distance = result['distance']
-                threshold = result['threshold']
-                verified = result['verified']
-                
-                logger.info(f"Comparing with {usuario['nome']}: distance={distance:.4f}, threshold={threshold:.4f}, verified={verified}")
-                
-                # Track the best match
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = (usuario, verified, distance)
-                
-            except Exception as e:
-                logger.error(f"Error comparing with user {usuario.get('nome', 'unknown')}: {e}")
-                continue
-        
-        # Clean up query image
-        os.unlink(query_path)
-        
+        with timer.stage("search"):
+            hits = face_index.search(query_embedding, k=1)
+        if hits:
+            usuario_id, distance = hits[0]
+            with timer.stage("load_user"):
+                usuario = await db.usuarios.find_one({"_id": ObjectId(usuario_id)}, USUARIO_RESUMO_PROJECTION)
+            if usuario:
+                verified = distance <= FACENET_COSINE_THRESHOLD
+                logger.info(f"Nearest user {usuario['nome']}: distance={distance:.4f}, threshold={FACENET_COSINE_THRESHOLD:.4f}, verified={verified}")
+                best_match = (usuario, verified, distance)
+
         # Check if we have a good match with balanced threshold
         # For Facenet with cosine distance, threshold is typically 0.4
         # Strict threshold: accept if distance < 0.13
         STRICT_THRESHOLD = 0.14
         RELAXED_VERIFIED_THRESHOLD = 0.18
         
+        logger.info(f"verify-face timings: {timer.summary()}")
+        
         if best_match:
             usuario, verified, distance = best_match
             is_match = (distance < STRICT_THRESHOLD) or (verified and distance < RELAXED_VERIFIED_THRESHOLD)
@@ -332,15 +686,19 @@ async def verify_face(request: FaceVerifyRequest):
                     f"MATCH FOUND: {usuario['nome']} with distance {distance:.4f} "
                     f"(strict={STRICT_THRESHOLD}, relaxed_verified={RELAXED_VERIFIED_THRESHOLD}, verified={verified})"
                 )
+                resumo = usuario_resumo(usuario)
+                if resumo['ja_votou']:
+                    # Nothing left to do for this visitor: no voting session
+                    return {
+                        "found": True,
+                        "ja_votou": True,
+                        "usuario": resumo
+                    }
                 return {
                     "found": True,
-                    "usuario": {
-                        "id": str(usuario['_id']),
-                        "nome": usuario['nome'],
-                        "cpf": usuario['cpf'],
-                        "telefone": usuario['telefone'],
-                        "ja_votou": usuario.get('ja_votou', False)
-                    }
+                    "ja_votou": False,
+                    "usuario": resumo,
+                    "session_token": issue_session_token(resumo['id'])
                 }
 
             logger.info(
@@ -352,13 +710,64 @@ async def verify_face(request: FaceVerifyRequest):
         
         return {"found": False, "message": "Rosto nÃ£o encontrado"}
         
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error in face verification: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Idempotency settings
+# Kiosks retry POSTs on flaky Wi-Fi; a retry carrying the same Idempotency-Key
+# gets the original response replayed instead of redoing the work.
+IDEMPOTENCY_STORE = os.environ.get('IDEMPOTENCY_STORE', 'memory')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+
+idempotency_cache = IdempotencyCache(
+    IDEMPOTENCY_MAX_ENTRIES,
+    IDEMPOTENCY_TTL_SECONDS,
+    db.idempotency_keys if IDEMPOTENCY_STORE == 'mongo' else None,
+)
+
+# Run an endpoint handler at most once per Idempotency-Key.
+# Only successful responses are stored, so a retry after an error runs again.
+async def run_idempotent(endpoint: str, idempotency_key: Optional[str], payload: BaseModel, handler):
+    if not idempotency_key:
+        return await handler()
+
+    key = f"{endpoint}:{idempotency_key}"
+    fingerprint = hashlib.sha256(payload.json().encode('utf-8')).hexdigest()
+    try:
+        replayed, body = await idempotency_cache.run(key, fingerprint, handler)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reutilizada com outra requisicao")
+    if replayed:
+        logger.info(f"Replaying {endpoint} response for Idempotency-Key {idempotency_key}")
+        return JSONResponse(content=body, headers={"Idempotent-Replayed": "true"})
+    return body
+
 # Register user with face
 @api_router.post("/register")
-async def register_user(usuario: UsuarioCadastro):
+async def register_user(usuario: UsuarioCadastro, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent("register", idempotency_key, usuario, lambda: _register_user(usuario))
+
+# Duplicate faces at registration
+# The new visitor's embedding is looked up in the face index before saving, so
+# the same person cannot register again under another CPF. "reject" refuses
+# the registration, "flag" saves it marked for review, "off" skips the check.
+DUPLICATE_FACE_ACTION = os.environ.get('DUPLICATE_FACE_ACTION', 'reject').lower()
+# Same distance verify-face accepts as a certain match
+DUPLICATE_FACE_THRESHOLD = float(os.environ.get('DUPLICATE_FACE_THRESHOLD', '0.14'))
+
+def find_duplicate_face(embedding) -> Optional[Tuple[str, float]]:
+    if DUPLICATE_FACE_ACTION == "off":
+        return None
+    hits = face_index.search(embedding, k=1)
+    if hits and hits[0][1] < DUPLICATE_FACE_THRESHOLD:
+        return hits[0]
+    return None
+
+async def _register_user(usuario: UsuarioCadastro):
     try:
         logger.info(f"Registering user: {usuario.nome}")
         
@@ -366,28 +775,75 @@ async def register_user(usuario: UsuarioCadastro):
             raise HTTPException(status_code=400, detail="Aceite do termo LGPD e obrigatorio")
 
         # Check if CPF already exists
-        existing = await db.usuarios.find_one({"cpf": usuario.cpf})
+        existing = await db.usuarios.find_one({"cpf": usuario.cpf}, {"_id": 1})
         if existing:
             raise HTTPException(status_code=400, detail="CPF jÃ¡ cadastrado")
         
-        # Validate face image
-        img = base64_to_image(usuario.face_image)
-        if img is None:
-            raise HTTPException(status_code=400, detail="Imagem invÃ¡lida")
+        timer = StageTimer("register")
+        async with face_pool_admission():
+            # Validate face image and build the compact photo stored for the user
+            prepared = await run_prepare_face(timer, usuario.face_image, store=True)
+            if not prepared.valid:
+                raise HTTPException(status_code=400, detail="Imagem invalida")
+            
+            # Compute the face embedding once so verification never re-runs Facenet on this user
+            face = prepared.face
+            if face is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Nenhum rosto detectado. Posicione seu rosto na moldura e tente novamente.",
+                )
+            with timer.stage("embed"):
+                embedding = await embedding_batcher.submit(face.crop)
+            stored_image = prepared.stored_image
+        logger.info(f"register timings: {timer.summary()}")
+        if embedding is None:
+            raise HTTPException(status_code=400, detail="Nao foi possivel processar o rosto. Tente novamente.")
+        
+        # Reuse the embedding just computed: only an index query, no extra Facenet pass
+        duplicate = find_duplicate_face(embedding)
+        if duplicate:
+            duplicate_id, distance = duplicate
+            logger.warning(f"Registration of {usuario.nome} matches user {duplicate_id} (distance={distance:.4f})")
+            if DUPLICATE_FACE_ACTION == "reject":
+                raise HTTPException(
+                    status_code=409,
+                    detail="Este rosto ja esta cadastrado. Procure a organizacao do evento.",
+                )
         
         # Save to database
         usuario_dict = usuario.dict()
+        usuario_dict['face_image'] = stored_image
+        usuario_dict.update(embedding_to_doc(embedding))
+        if duplicate:
+            usuario_dict['possivel_duplicado_de'] = duplicate[0]
+            usuario_dict['possivel_duplicado_distancia'] = duplicate[1]
         usuario_dict['ja_votou'] = False
         usuario_dict['created_at'] = datetime.utcnow()
         usuario_dict['lgpd_aceito_em'] = datetime.utcnow()
         
-        result = await db.usuarios.insert_one(usuario_dict)
+        try:
+            result = await db.usuarios.insert_one(usuario_dict)
+        except DuplicateKeyError:
+            # Concurrent registration with the same CPF
+            raise HTTPException(status_code=400, detail="CPF ja cadastrado")
+        face_index.add(str(result.inserted_id), embedding)
+        mark_face_index_dirty()
+        
+        # Keep the original camera frame outside the hot collection if requested
+        if FACE_ARCHIVE_ORIGINALS:
+            await db.usuarios_fotos_originais.insert_one({
+                "usuario_id": str(result.inserted_id),
+                "face_image": usuario.face_image,
+                "created_at": datetime.utcnow()
+            })
         
         logger.info(f"User registered with ID: {result.inserted_id}")
         
         return {
             "success": True,
             "usuario_id": str(result.inserted_id),
+            "session_token": issue_session_token(str(result.inserted_id)),
             "message": "UsuÃ¡rio cadastrado com sucesso"
         }
         
@@ -398,54 +854,572 @@ async def register_user(usuario: UsuarioCadastro):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Get all turmas for voting
+# Turma photos
+# Photos are kept out of turma documents and served as binary JPEGs from
+# /api/turmas/{id}/foto; URLs carry the photo version so they can be cached
+# forever by kiosks. Each photo is stored in every size of TURMA_FOTO_SIZES.
+TURMA_FOTO_SIZES = {
+    "full": int(os.environ.get('TURMA_FOTO_MAX_SIDE', '1280')),
+    "thumb": int(os.environ.get('TURMA_FOTO_THUMB_SIDE', '320')),
+}
+TURMA_FOTO_JPEG_QUALITY = int(os.environ.get('TURMA_FOTO_JPEG_QUALITY', '82'))
+# Legacy documents may still carry the inline photo
+TURMA_PROJECTION = {"foto_base64": 0}
+
+# Helper function to build every stored size of a turma photo (None if invalid)
+def build_turma_fotos(foto_base64: str) -> Optional[dict]:
+    img = base64_to_image(foto_base64)
+    if img is None:
+        return None
+    return {
+        size: image_to_jpeg(downscale_image(img, max_side), TURMA_FOTO_JPEG_QUALITY)
+        for size, max_side in TURMA_FOTO_SIZES.items()
+    }
+
+async def prepare_turma_fotos(foto_base64: str) -> Tuple[dict, str]:
+    # Rare admin upload: resized in a thread of the API process, not in a face worker
+    fotos = await asyncio.to_thread(build_turma_fotos, foto_base64)
+    if fotos is None:
+        raise HTTPException(status_code=400, detail="Imagem invalida")
+    versao = hashlib.sha1(fotos['full']).hexdigest()[:12]
+    return fotos, versao
+
+async def store_turma_fotos(turma_id: str, fotos: dict, versao: str):
+    await db.turma_fotos.replace_one(
+        {"_id": turma_id},
+        {**fotos, "versao": versao, "updated_at": datetime.utcnow()},
+        upsert=True
+    )
+
+# Turma as returned by the API: no inline photo, URLs to the photo endpoint instead
+def turma_public(turma) -> dict:
+    turma = serialize_doc(turma)
+    turma.pop('foto_base64', None)
+    # Only ever seeded by the migration to sharded counters; with_vote_counts adds the live count
+    turma.pop('votos_count', None)
+    versao = turma.pop('foto_versao', None)
+    if versao:
+        turma['foto_url'] = f"/api/turmas/{turma['_id']}/foto?size=full&v={versao}"
+        turma['foto_thumb_url'] = f"/api/turmas/{turma['_id']}/foto?size=thumb&v={versao}"
+    else:
+        turma['foto_url'] = None
+        turma['foto_thumb_url'] = None
+    return turma
+
+# Move inline photos of turmas created before the photo endpoint existed
+async def migrate_turma_fotos():
+    migrated = 0
+    legacy = db.turmas.find({"foto_base64": {"$exists": True}}, {"foto_base64": 1})
+    async for turma in stream_cursor(legacy):
+        try:
+            fotos, versao = await prepare_turma_fotos(turma['foto_base64'])
+        except HTTPException:
+            logger.error(f"Turma {turma['_id']} has an invalid photo, keeping it inline")
+            continue
+        await store_turma_fotos(str(turma['_id']), fotos, versao)
+        await db.turmas.update_one(
+            {"_id": turma['_id']},
+            {"$set": {"foto_versao": versao}, "$unset": {"foto_base64": ""}}
+        )
+        migrated += 1
+    if migrated:
+        logger.info(f"Moved {migrated} turma photos to turma_fotos")
+        await on_turmas_changed()
+
+@api_router.get("/turmas/{turma_id}/foto")
+async def get_turma_foto(turma_id: str, size: str = "full"):
+    try:
+        if size not in TURMA_FOTO_SIZES:
+            raise HTTPException(status_code=400, detail=f"Tamanho invalido: use {', '.join(TURMA_FOTO_SIZES)}")
+        
+        foto = await db.turma_fotos.find_one({"_id": turma_id}, {size: 1, "versao": 1})
+        if not foto:
+            raise HTTPException(status_code=404, detail="Foto nao encontrada")
+        
+        return Response(
+            content=bytes(foto[size]),
+            media_type="image/jpeg",
+            headers={
+                "Cache-Control": "public, max-age=31536000, immutable",
+                "ETag": f'"{foto["versao"]}-{size}"'
+            }
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error getting turma photo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Turma list caching
+# The turma list changes a few times a day; every change bumps a version kept
+# in admin_config. It is used as ETag and as key of the serialized body cache.
+turmas_list_cache: Dict[str, Tuple[str, bytes]] = {}  # list name -> (etag, body)
+
+async def get_turmas_version() -> int:
+    doc = await db.admin_config.find_one({"type": "turmas_version"}, {"version": 1})
+    return doc['version'] if doc else 0
+
+async def on_turmas_changed():
+    await db.admin_config.update_one(
+        {"type": "turmas_version"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    turmas_list_cache.clear()
+    await results_snapshot.load()
+
+# Serve a cached JSON body, or 304 when the client already has this version
+async def cached_json_response(name: str, etag: str, if_none_match: Optional[str], build_body) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    cached = turmas_list_cache.get(name)
+    if cached is None or cached[0] != etag:
+        body = json.dumps(jsonable_encoder(await build_body())).encode('utf-8')
+        cached = (etag, body)
+        turmas_list_cache[name] = cached
+    return Response(content=cached[1], media_type="application/json", headers=headers)
+
 @api_router.get("/turmas")
-async def get_turmas():
+async def get_turmas(if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     try:
-        turmas = await db.turmas.find().to_list(1000)
-        return [{**serialize_doc(t)} for t in turmas]
+        version = await get_turmas_version()
+
+        async def build_body():
+            return [turma_public(t) async for t in stream_cursor(db.turmas.find({}, TURMA_PROJECTION))]
+
+        return await cached_json_response("turmas", f'W/"turmas-{version}"', if_none_match, build_body)
     except Exception as e:
         logger.error(f"Error getting turmas: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Sharded vote counters
+# Votes are counted in VOTE_COUNTER_SHARDS small documents per turma in
+# turma_contadores (summed on read) so a popular turma is not a single hot
+# document, and turmas documents (with their photos) stay read-mostly.
+VOTE_COUNTER_SHARDS = int(os.environ.get('VOTE_COUNTER_SHARDS', '8'))
+
+# Increment of a counter document. With a batch id (lote) the increment is
+# applied at most once: the document remembers the lotes it already counted
+# until they are released by release_lote, and a retry of the same lote
+# matches nothing (its upsert then fails with a duplicate key, ignored).
+def counter_update(doc_id: str, n: int, set_on_insert: dict, lote: Optional[str] = None) -> UpdateOne:
+    if lote is None:
+        return UpdateOne({"_id": doc_id}, {"$inc": {"count": n}, "$setOnInsert": set_on_insert}, upsert=True)
+    return UpdateOne(
+        {"_id": doc_id, "lotes": {"$ne": lote}},
+        {"$inc": {"count": n}, "$push": {"lotes": lote}, "$setOnInsert": set_on_insert},
+        upsert=True
+    )
+
+async def apply_counter_updates(collection, operations: List[UpdateOne]):
+    if not operations:
+        return
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as bwe:
+        # Duplicate keys are increments a previous attempt of the lote already applied
+        if any(err.get('code') != 11000 for err in bwe.details.get('writeErrors', [])):
+            raise
+
+async def release_lote(collection, doc_ids: List[str], lote: str):
+    await collection.update_many({"_id": {"$in": doc_ids}}, {"$pull": {"lotes": lote}})
+
+def counter_shard(turma_id: str, lote: Optional[str]) -> int:
+    if lote is None:
+        return random.randrange(VOTE_COUNTER_SHARDS)
+    # A retried lote must hit the same shard documents
+    return zlib.crc32(f"{lote}:{turma_id}".encode('utf-8')) % VOTE_COUNTER_SHARDS
+
+def counter_ids(counts: Dict[str, int], lote: str) -> List[str]:
+    return [f"{turma_id}:{counter_shard(turma_id, lote)}" for turma_id in counts]
+
+async def increment_vote_counters(counts: Dict[str, int], lote: Optional[str] = None):
+    operations = []
+    for turma_id, n in counts.items():
+        shard = counter_shard(turma_id, lote)
+        operations.append(counter_update(
+            f"{turma_id}:{shard}", n, {"turma_id": turma_id, "shard": shard}, lote
+        ))
+    await apply_counter_updates(db.turma_contadores, operations)
+
+# Current vote count of every turma that received votes
+async def get_vote_counts() -> Dict[str, int]:
+    pipeline = [{"$group": {"_id": "$turma_id", "total": {"$sum": "$count"}}}]
+    return {doc['_id']: doc['total'] async for doc in db.turma_contadores.aggregate(pipeline)}
+
+# Replace the stored votos_count of turma documents with the live count
+def with_vote_counts(turma, counts: Dict[str, int]):
+    turma = turma_public(turma)
+    turma['votos_count'] = counts.get(turma['_id'], 0)
+    return turma
+
+# Seed counters from turmas.votos_count for data created before sharding
+async def migrate_vote_counters():
+    if await db.turma_contadores.find_one({}, {"_id": 1}):
+        return
+    counts = {}
+    async for turma in stream_cursor(db.turmas.find({"votos_count": {"$gt": 0}}, {"votos_count": 1})):
+        counts[str(turma['_id'])] = turma['votos_count']
+    if counts:
+        await increment_vote_counters(counts)
+        logger.info(f"Migrated vote counts of {len(counts)} turmas to sharded counters")
+
+# Vote rollups for the reports
+# Each vote increments one hourly and one per-minute document in
+# votos_rollup, keyed by the fair's local time, so the reports read a few
+# small documents instead of aggregating every ballot.
+REPORTS_TIMEZONE = os.environ.get('REPORTS_TIMEZONE', 'America/Manaus')
+REPORTS_TZ = ZoneInfo(REPORTS_TIMEZONE)
+REPORTS_MINUTE_WINDOW = int(os.environ.get('REPORTS_MINUTE_WINDOW', '60'))
+
+# Vote timestamps are stored as naive UTC
+def to_local_time(timestamp: datetime) -> datetime:
+    return timestamp.replace(tzinfo=timezone.utc).astimezone(REPORTS_TZ)
+
+def rollup_keys(timestamp: datetime) -> Tuple[str, str]:
+    local = to_local_time(timestamp)
+    return f"hora:{local:%Y-%m-%dT%H}", f"minuto:{local:%Y-%m-%dT%H:%M}"
+
+def rollup_update(key: str, n: int, lote: Optional[str] = None) -> UpdateOne:
+    tipo, inicio = key.split(":", 1)
+    return counter_update(key, n, {"tipo": tipo, "inicio": inicio}, lote)
+
+def rollup_counts(timestamps: List[datetime]) -> Counter:
+    por_chave = Counter()
+    for timestamp in timestamps:
+        por_chave.update(rollup_keys(timestamp))
+    return por_chave
+
+async def increment_vote_rollups(timestamps: List[datetime], lote: Optional[str] = None):
+    por_chave = rollup_counts(timestamps)
+    await apply_counter_updates(
+        db.votos_rollup,
+        [rollup_update(key, n, lote) for key, n in por_chave.items()]
+    )
+
+# Recompute the rollups from the ballots (backfill after an upgrade or a
+# repair). Votes cast while it runs may be counted in the old documents only.
+async def rebuild_vote_rollups() -> int:
+    pipeline = [
+        {"$match": {"timestamp": {"$type": "date"}}},
+        {
+            "$group": {
+                "_id": {
+                    "hora": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$timestamp", "timezone": REPORTS_TIMEZONE}},
+                    "minuto": {"$dateToString": {"format": "%Y-%m-%dT%H:%M", "date": "$timestamp", "timezone": REPORTS_TIMEZONE}}
+                },
+                "count": {"$sum": 1}
+            }
+        }
+    ]
+    por_chave = Counter()
+    async for doc in db.votos.aggregate(pipeline, allowDiskUse=True):
+        por_chave[f"hora:{doc['_id']['hora']}"] += doc['count']
+        por_chave[f"minuto:{doc['_id']['minuto']}"] += doc['count']
+    await db.votos_rollup.delete_many({})
+    if por_chave:
+        await db.votos_rollup.bulk_write(
+            [rollup_update(key, n) for key, n in por_chave.items()],
+            ordered=False
+        )
+    return sum(n for key, n in por_chave.items() if key.startswith("hora:"))
+
+# Build the rollups once for votes cast before they existed
+async def migrate_vote_rollups():
+    if await db.votos_rollup.find_one({}, {"_id": 1}):
+        return
+    if await db.votos.find_one({}, {"_id": 1}):
+        total = await rebuild_vote_rollups()
+        logger.info(f"Built vote rollups for {total} existing votes")
+
+# Results snapshot
+# The admin dashboard polls the ranking every few seconds; it is served from
+# memory and updated incrementally on each vote instead of re-reading turmas.
+RESULTS_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('RESULTS_SNAPSHOT_REFRESH_SECONDS', '30'))
+TURMA_RESUMO_PROJECTION = {"nome_turma": 1, "nome_projeto": 1, "numero_barraca": 1}
+
+class ResultsSnapshot:
+    """Ranking, totals and percentages of the vote (no photos), with a
+    version number bumped on every change."""
+
+    def __init__(self):
+        self.turmas: Dict[str, dict] = {}
+        self.counts: Dict[str, int] = {}
+        self.version = 0
+        self._response = None
+        # Vote counter writes in progress, and whether load() is reading the
+        # counters: the two exclude each other (see writing_votes)
+        self._writing = 0
+        self._reading = False
+        self._idle = asyncio.Condition()
+
+    async def load(self):
+        turmas = {}
+        async for t in stream_cursor(db.turmas.find({}, TURMA_RESUMO_PROJECTION)):
+            t = serialize_doc(t)
+            turmas[t['_id']] = t
+
+        # Read the counters while no vote is between its counter write and
+        # apply_votes, so the counts read match the votes applied so far
+        async with self._idle:
+            await self._idle.wait_for(lambda: not self._reading)
+            # Set before waiting for writes in progress: new ones queue up
+            # behind this read instead of postponing it indefinitely
+            self._reading = True
+        try:
+            async with self._idle:
+                await self._idle.wait_for(lambda: self._writing == 0)
+            counts = await get_vote_counts()
+        finally:
+            async with self._idle:
+                self._reading = False
+                self._idle.notify_all()
+
+        if turmas != self.turmas or counts != self.counts:
+            self.turmas = turmas
+            self.counts = counts
+            self._changed()
+
+    @asynccontextmanager
+    async def writing_votes(self):
+        """Wrap the counter writes of votes and their apply_votes call, so a
+        concurrent load() cannot take them from the database and then have
+        apply_votes add them a second time."""
+        async with self._idle:
+            await self._idle.wait_for(lambda: not self._reading)
+            self._writing += 1
+        try:
+            yield
+        finally:
+            async with self._idle:
+                self._writing -= 1
+                self._idle.notify_all()
+
+    def apply_votes(self, counts: Dict[str, int]):
+        for turma_id, n in counts.items():
+            self.counts[turma_id] = self.counts.get(turma_id, 0) + n
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._response = None
+
+    def response(self) -> dict:
+        if self._response is None:
+            total_votos = sum(self.counts.get(turma_id, 0) for turma_id in self.turmas)
+            ranking = []
+            for turma_id, turma in self.turmas.items():
+                votos = self.counts.get(turma_id, 0)
+                ranking.append({
+                    **turma,
+                    "votos_count": votos,
+                    "percentual": round(votos / total_votos * 100, 1) if total_votos else 0.0
+                })
+            ranking.sort(key=lambda t: t['votos_count'], reverse=True)
+            self._response = {
+                "version": self.version,
+                "total_votos": total_votos,
+                "turmas": ranking
+            }
+        return self._response
+
+results_snapshot = ResultsSnapshot()
+
+# Live results stream
+# Dashboards subscribe over Server-Sent Events; a burst of votes is coalesced
+# into at most one message per RESULTS_STREAM_INTERVAL seconds.
+RESULTS_STREAM_INTERVAL = float(os.environ.get('RESULTS_STREAM_INTERVAL', '1.0'))
+RESULTS_STREAM_HEARTBEAT = float(os.environ.get('RESULTS_STREAM_HEARTBEAT', '15'))
+
+class ResultsBroadcaster:
+    """Turns snapshot changes into compact diffs for every subscriber."""
+
+    def __init__(self, snapshot: ResultsSnapshot):
+        self.snapshot = snapshot
+        self.subscribers = set()
+        self._sent_version = snapshot.version
+        self._sent_counts: Dict[str, int] = {}
+        self._sent_turmas: Dict[str, dict] = {}
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=16)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def _message(self):
+        snapshot = self.snapshot.response()
+        counts = {t['_id']: t['votos_count'] for t in snapshot['turmas']}
+        if self.snapshot.turmas != self._sent_turmas:
+            # Turmas were added, removed or edited (load() replaces the dict
+            # then): diffs only carry counts, so send the whole ranking
+            message = ("snapshot", snapshot)
+        else:
+            message = ("diff", {
+                "version": snapshot['version'],
+                "total_votos": snapshot['total_votos'],
+                "counts": {turma_id: n for turma_id, n in counts.items() if self._sent_counts.get(turma_id) != n}
+            })
+        self._sent_version = snapshot['version']
+        self._sent_counts = counts
+        self._sent_turmas = self.snapshot.turmas
+        return message
+
+    def publish(self):
+        if self.snapshot.version == self._sent_version:
+            return
+        message = self._message()
+        for queue in list(self.subscribers):
+            if queue.full():
+                # Slow client: drop its backlog and resync it with a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.snapshot.response()))
+            else:
+                queue.put_nowait(message)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(RESULTS_STREAM_INTERVAL)
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing results: {e}")
+
+results_broadcaster = ResultsBroadcaster(results_snapshot)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Reconcile the snapshot with MongoDB (votes handled by other API workers)
+async def results_snapshot_refresher():
+    while True:
+        await asyncio.sleep(RESULTS_SNAPSHOT_REFRESH_SECONDS)
+        try:
+            await results_snapshot.load()
+        except Exception as e:
+            logger.error(f"Error refreshing results snapshot: {e}")
+
+# Write-behind vote ingestion (optional)
+# When enabled, a vote is acknowledged once its ballot is in the local journal;
+# ballots and counters are written to MongoDB in batches by a background task.
+# Each API worker journals to its own VOTE_JOURNAL_PATH.N file.
+VOTE_WRITE_BEHIND = os.environ.get('VOTE_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+VOTE_JOURNAL_PATH = os.environ.get('VOTE_JOURNAL_PATH', str(ROOT_DIR / 'votos.journal'))
+VOTE_FLUSH_INTERVAL = float(os.environ.get('VOTE_FLUSH_INTERVAL', '1.0'))
+VOTE_FLUSH_BATCH = int(os.environ.get('VOTE_FLUSH_BATCH', '500'))
+
+# Counter increments of a lote of write-behind ballots (see vote_batches.py)
+async def count_vote_lote(lote: str, por_turma: Counter, horarios: List[datetime]):
+    async with results_snapshot.writing_votes():
+        await increment_vote_counters(por_turma, lote)
+        await increment_vote_rollups(horarios, lote)
+        results_snapshot.apply_votes(por_turma)
+
+# The lote can no longer be retried; its markers are not needed anymore
+async def release_vote_lote(lote: str, por_turma: Counter, horarios: List[datetime]):
+    await release_lote(db.turma_contadores, counter_ids(por_turma, lote), lote)
+    await release_lote(db.votos_rollup, list(rollup_counts(horarios)), lote)
+
+async def flush_vote_batch(batch: List[dict]):
+    await store_vote_batch(db.votos, batch, count_vote_lote, release_vote_lote, MONGO_BATCH_SIZE)
+
+vote_queue = VoteQueue(
+    VOTE_JOURNAL_PATH,
+    flush_vote_batch,
+    flush_interval=VOTE_FLUSH_INTERVAL,
+    max_batch=VOTE_FLUSH_BATCH,
+) if VOTE_WRITE_BEHIND else None
+
 # Vote endpoint
 @api_router.post("/vote")
-async def vote(vote_request: VoteRequest):
+async def vote(vote_request: VoteRequest, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await run_idempotent("vote", idempotency_key, vote_request, lambda: _vote(vote_request))
+
+async def _vote(vote_request: VoteRequest):
     try:
         logger.info(f"Processing vote from user {vote_request.usuario_id} for turma {vote_request.turma_id}")
         
-        # Check if user exists
-        usuario = await db.usuarios.find_one({"_id": ObjectId(vote_request.usuario_id)})
-        if not usuario:
-            raise HTTPException(status_code=404, detail="UsuÃ¡rio nÃ£o encontrado")
+        # The session proves who is voting
+        sessao = read_session_token(vote_request.session_token) if vote_request.session_token else None
+        if sessao is None and VOTE_REQUIRE_SESSION:
+            raise HTTPException(status_code=401, detail="Sessao de votacao invalida ou expirada. Identifique-se novamente.")
+        if sessao is not None and sessao['uid'] != vote_request.usuario_id:
+            raise HTTPException(status_code=403, detail="Sessao de votacao pertence a outro usuario")
         
-        # Check if user already voted
-        if usuario.get('ja_votou', False):
-            raise HTTPException(status_code=400, detail="VocÃª jÃ¡ realizou sua votaÃ§Ã£o")
+        usuario_oid = ObjectId(vote_request.usuario_id)
+        turma_oid = ObjectId(vote_request.turma_id)
         
-        # Check if turma exists
-        turma = await db.turmas.find_one({"_id": ObjectId(vote_request.turma_id)})
-        if not turma:
-            raise HTTPException(status_code=404, detail="Turma nÃ£o encontrada")
+        # Check if turma exists (the results snapshot knows every turma;
+        # fall back to the database for one created on another worker)
+        if vote_request.turma_id not in results_snapshot.turmas:
+            turma = await db.turmas.find_one({"_id": turma_oid}, {"_id": 1})
+            if not turma:
+                raise HTTPException(status_code=404, detail="Turma nao encontrada")
+        
+        # Check eligibility and mark the user as voted in one atomic operation,
+        # so two concurrent taps from the same visitor cannot both pass
+        now = datetime.utcnow()
+        usuario = await db.usuarios.find_one_and_update(
+            {"_id": usuario_oid, "ja_votou": {"$ne": True}},
+            {"$set": {"ja_votou": True, "votou_em": now}},
+            projection={"_id": 1}
+        )
+        if not usuario:
+            # A verified session means the user exists, so they already voted
+            if sessao is not None or await db.usuarios.find_one({"_id": usuario_oid}, {"_id": 1}):
+                raise HTTPException(status_code=400, detail="Voce ja realizou sua votacao")
+            raise HTTPException(status_code=404, detail="Usuario nao encontrado")
         
-        # Register vote
+        if vote_queue is not None:
+            try:
+                await vote_queue.enqueue({
+                    "_id": str(ObjectId()),
+                    "usuario_id": vote_request.usuario_id,
+                    "turma_id": vote_request.turma_id,
+                    "timestamp": now.isoformat()
+                })
+            except Exception:
+                # Not journaled: give the visitor their vote back
+                await db.usuarios.update_one(
+                    {"_id": usuario_oid},
+                    {"$set": {"ja_votou": False}, "$unset": {"votou_em": ""}}
+                )
+                raise
+            logger.info(f"Vote queued ({vote_queue.depth} pending)")
+            return {
+                "success": True,
+                "message": "Voto registrado com sucesso!"
+            }
+        
+        # Register vote and increment vote count for turma
         voto_dict = {
             "usuario_id": vote_request.usuario_id,
             "turma_id": vote_request.turma_id,
-            "timestamp": datetime.utcnow()
+            "timestamp": now
         }
-        await db.votos.insert_one(voto_dict)
-        
-        # Update user as voted
-        await db.usuarios.update_one(
-            {"_id": ObjectId(vote_request.usuario_id)},
-            {"$set": {"ja_votou": True}}
-        )
+        try:
+            await db.votos.insert_one(voto_dict)
+        except DuplicateKeyError:
+            # A ballot already exists for this user (unique votos.usuario_id)
+            raise HTTPException(status_code=400, detail="Voce ja realizou sua votacao")
+        except Exception:
+            # Give the visitor their vote back if the ballot could not be stored
+            await db.usuarios.update_one(
+                {"_id": usuario_oid},
+                {"$set": {"ja_votou": False}, "$unset": {"votou_em": ""}}
+            )
+            raise
         
         # Increment vote count for turma
-        await db.turmas.update_one(
-            {"_id": ObjectId(vote_request.turma_id)},
-            {"$inc": {"votos_count": 1}}
-        )
+        async with results_snapshot.writing_votes():
+            await increment_vote_counters({vote_request.turma_id: 1})
+            await increment_vote_rollups([now])
+            results_snapshot.apply_votes({vote_request.turma_id: 1})
         
         logger.info(f"Vote registered successfully")
         
@@ -466,11 +1440,17 @@ async def create_turma(turma: TurmaCreate):
     try:
         logger.info(f"Creating turma: {turma.nome_turma}")
         
-        turma_dict = turma.dict()
-        turma_dict['votos_count'] = 0
+        if not turma.foto_base64:
+            raise HTTPException(status_code=400, detail="Foto do projeto e obrigatoria")
+        fotos, versao = await prepare_turma_fotos(turma.foto_base64)
+        
+        turma_dict = turma.dict(exclude={"foto_base64"})
+        turma_dict['foto_versao'] = versao
         turma_dict['created_at'] = datetime.utcnow()
         
         result = await db.turmas.insert_one(turma_dict)
+        await store_turma_fotos(str(result.inserted_id), fotos, versao)
+        await on_turmas_changed()
         
         return {
             "success": True,
@@ -478,15 +1458,24 @@ async def create_turma(turma: TurmaCreate):
             "message": "Turma cadastrada com sucesso"
         }
         
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error creating turma: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/admin/turmas")
-async def get_admin_turmas():
+async def get_admin_turmas(if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     try:
-        turmas = await db.turmas.find().to_list(1000)
-        return [{**serialize_doc(t)} for t in turmas]
+        version = await get_turmas_version()
+        # The admin list also shows vote counts, so they are part of its version
+        counts = await get_vote_counts()
+        counts_hash = hashlib.sha1(json.dumps(counts, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+        async def build_body():
+            return [with_vote_counts(t, counts) async for t in stream_cursor(db.turmas.find({}, TURMA_PROJECTION))]
+
+        return await cached_json_response("admin_turmas", f'W/"admin-turmas-{version}-{counts_hash}"', if_none_match, build_body)
     except Exception as e:
         logger.error(f"Error getting admin turmas: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -497,6 +1486,9 @@ async def delete_turma(turma_id: str):
         result = await db.turmas.delete_one({"_id": ObjectId(turma_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Turma nÃ£o encontrada")
+        await db.turma_contadores.delete_many({"turma_id": turma_id})
+        await db.turma_fotos.delete_one({"_id": turma_id})
+        await on_turmas_changed()
         
         return {
             "success": True,
@@ -511,21 +1503,33 @@ async def update_turma(turma_id: str, turma: TurmaCreate):
     try:
         logger.info(f"Updating turma: {turma_id}")
         
-        turma_dict = turma.dict()
+        turma_dict = turma.dict(exclude={"foto_base64"})
         turma_dict['updated_at'] = datetime.utcnow()
         
+        fotos = None
+        if turma.foto_base64:
+            fotos, versao = await prepare_turma_fotos(turma.foto_base64)
+            turma_dict['foto_versao'] = versao
+            # Store the photo before its version becomes visible in the listings
+            await store_turma_fotos(turma_id, fotos, versao)
+        
         result = await db.turmas.update_one(
             {"_id": ObjectId(turma_id)},
-            {"$set": turma_dict}
+            {"$set": turma_dict, "$unset": {"foto_base64": ""}} if fotos else {"$set": turma_dict}
         )
         
         if result.matched_count == 0:
+            if fotos:
+                await db.turma_fotos.delete_one({"_id": turma_id})
             raise HTTPException(status_code=404, detail="Turma nÃ£o encontrada")
+        await on_turmas_changed()
         
         return {
             "success": True,
             "message": "Turma atualizada com sucesso"
         }
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error updating turma: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -533,77 +1537,123 @@ async def update_turma(turma_id: str, turma: TurmaCreate):
 @api_router.get("/admin/reports")
 async def get_reports():
     try:
-        # Total de usuÃ¡rios cadastrados
-        total_usuarios = await db.usuarios.count_documents({})
-        
-        # Total de votos
-        total_votos = await db.votos.count_documents({})
+        # Total de usuarios cadastrados (from collection metadata, no scan)
+        total_usuarios = await db.usuarios.estimated_document_count()
         
-        # Votos por hora
-        pipeline = [
-            {
-                "$project": {
-                    "hour": {"$hour": "$timestamp"}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$hour",
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"count": -1}
-            }
-        ]
+        # Votos por hora do dia, no fuso da feira
+        por_hora = Counter()
+        async for doc in db.votos_rollup.find({"tipo": "hora"}, {"inicio": 1, "count": 1}):
+            por_hora[int(doc['inicio'][-2:])] += doc['count']
+        votos_por_hora = [{"_id": hora, "count": por_hora[hora]} for hora in sorted(por_hora)]
         
-        votos_por_hora = await db.votos.aggregate(pipeline).to_list(24)
+        # Total de votos
+        total_votos = sum(por_hora.values())
         
         # HorÃ¡rio de pico
         horario_pico = None
-        if votos_por_hora:
+        if por_hora:
+            hora_pico = max(por_hora, key=por_hora.get)
             horario_pico = {
-                "hora": votos_por_hora[0]['_id'],
-                "total_votos": votos_por_hora[0]['count']
+                "hora": hora_pico,
+                "total_votos": por_hora[hora_pico]
             }
         
+        # Votos por minuto na ultima janela
+        desde = to_local_time(datetime.utcnow() - timedelta(minutes=REPORTS_MINUTE_WINDOW))
+        votos_por_minuto = [
+            {"minuto": doc['inicio'], "count": doc['count']}
+            async for doc in db.votos_rollup.find(
+                {"tipo": "minuto", "inicio": {"$gt": f"{desde:%Y-%m-%dT%H:%M}"}},
+                {"inicio": 1, "count": 1}
+            ).sort("inicio", 1)
+        ]
+        
         # Votos por turma (top 5)
-        turmas = await db.turmas.find().sort("votos_count", -1).limit(5).to_list(5)
+        counts = await get_vote_counts()
+        top_ids = sorted(counts, key=counts.get, reverse=True)[:5]
+        turmas = [
+            with_vote_counts(t, counts)
+            async for t in db.turmas.find({"_id": {"$in": [ObjectId(t) for t in top_ids]}}, TURMA_PROJECTION)
+        ]
+        if len(turmas) < 5:
+            # Not enough voted turmas yet: complete the list with unvoted ones
+            sem_votos = db.turmas.find({"_id": {"$nin": [ObjectId(t['_id']) for t in turmas]}}, TURMA_PROJECTION).limit(5 - len(turmas))
+            turmas.extend([with_vote_counts(t, counts) async for t in sem_votos])
+        turmas.sort(key=lambda t: t['votos_count'], reverse=True)
         
         return {
             "total_usuarios": total_usuarios,
             "total_votos": total_votos,
             "horario_pico": horario_pico,
             "votos_por_hora": votos_por_hora,
-            "top_projetos": [{**serialize_doc(t)} for t in turmas]
+            "votos_por_minuto": votos_por_minuto,
+            "fuso_horario": REPORTS_TIMEZONE,
+            "top_projetos": turmas
         }
     except Exception as e:
         logger.error(f"Error getting reports: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/admin/results")
-async def get_results():
+@api_router.post("/admin/reports/rebuild")
+async def rebuild_reports():
     try:
-        turmas = await db.turmas.find().sort("votos_count", -1).to_list(1000)
-        total_votos = sum(t.get('votos_count', 0) for t in turmas)
-        
-        return {
-            "total_votos": total_votos,
-            "turmas": [{**serialize_doc(t)} for t in turmas]
-        }
+        total_votos = await rebuild_vote_rollups()
+        logger.info(f"Rebuilt vote rollups from {total_votos} votes")
+        return {"success": True, "total_votos": total_votos}
     except Exception as e:
-        logger.error(f"Error getting results: {e}")
+        logger.error(f"Error rebuilding reports: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/admin/results")
+async def get_results():
+    return results_snapshot.response()
+
+@api_router.get("/admin/results/stream")
+async def stream_results():
+    queue = results_broadcaster.subscribe()
+
+    async def events():
+        try:
+            # Full ranking first, then diffs as votes land
+            yield sse_event("snapshot", results_snapshot.response())
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=RESULTS_STREAM_HEARTBEAT)
+                    yield sse_event(event, data)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+        finally:
+            results_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.delete("/admin/reset-all")
 async def reset_all_data():
     try:
         logger.warning("RESETTING ALL DATA - This will delete all users, votes, and turmas!")
         
+        # Pending ballots would be flushed after the wipe otherwise
+        if vote_queue is not None:
+            await vote_queue.discard()
+        
         # Delete all data
         usuarios_deleted = await db.usuarios.delete_many({})
         votos_deleted = await db.votos.delete_many({})
         turmas_deleted = await db.turmas.delete_many({})
+        await db.turma_contadores.delete_many({})
+        await db.votos_rollup.delete_many({})
+        await db.turma_fotos.delete_many({})
+        await on_turmas_changed()
+        await db.usuarios_fotos_originais.delete_many({})
+        # Replaying a stored response would refer to users and votes that no longer exist
+        await idempotency_cache.clear()
+        face_index.clear()
+        await save_face_index()
         
         logger.info(f"Reset complete: {usuarios_deleted.deleted_count} users, {votos_deleted.deleted_count} votes, {turmas_deleted.deleted_count} turmas deleted")
         
@@ -620,10 +1670,169 @@ async def reset_all_data():
         logger.error(f"Error resetting data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Warm up the face models in every pool worker, then mark the API ready
+async def warm_up_face_pool():
+    global face_models_ready, face_models_error
+    try:
+        start = time.perf_counter()
+        if face_workers is not None:
+            # Each worker process loads and warms its own models when it starts
+            await face_workers.wait_ready()
+        else:
+            # First run builds the shared model; the others warm remaining workers
+            await run_in_face_pool(None, "warmup", warm_up_face_models, FACE_EMBED_BATCH_SIZE)
+            await asyncio.gather(*[
+                run_in_face_pool(None, "warmup", warm_up_face_models, FACE_EMBED_BATCH_SIZE)
+                for _ in range(FACE_POOL_WORKERS - 1)
+            ])
+        face_models_ready = True
+        logger.info(f"Face models warmed up in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        face_models_error = str(e)
+        logger.error(f"Error warming up face models: {e}")
+
+# Readiness check: not ready until the face models are loaded
+@api_router.get("/ready")
+async def readiness():
+    if not face_models_available():
+        error = face_models_error or (face_workers.halted_error if face_workers is not None else None)
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "error": error},
+            headers={"Retry-After": str(FACE_POOL_RETRY_AFTER)},
+        )
+    return {"ready": True}
+
+# Registered photo of a user (the only endpoint that reads face_image)
+@api_router.get("/admin/usuarios/{usuario_id}/foto")
+async def get_usuario_foto(usuario_id: str):
+    try:
+        usuario = await db.usuarios.find_one({"_id": ObjectId(usuario_id)}, {"face_image": 1})
+        if not usuario:
+            raise HTTPException(status_code=404, detail="Usuario nao encontrado")
+        
+        return {
+            "usuario_id": usuario_id,
+            "face_image": usuario.get('face_image')
+        }
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error getting user photo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Users saved with DUPLICATE_FACE_ACTION=flag whose face matched another user
+@api_router.get("/admin/usuarios/duplicados")
+async def get_usuarios_duplicados():
+    try:
+        duplicados = []
+        cursor = db.usuarios.find(
+            {"possivel_duplicado_de": {"$exists": True}},
+            {**USUARIO_RESUMO_PROJECTION, "possivel_duplicado_de": 1, "possivel_duplicado_distancia": 1, "created_at": 1}
+        )
+        async for usuario in stream_cursor(cursor):
+            duplicados.append({
+                **usuario_resumo(usuario),
+                "possivel_duplicado_de": usuario['possivel_duplicado_de'],
+                "distancia": usuario.get('possivel_duplicado_distancia'),
+                "created_at": usuario.get('created_at')
+            })
+        return {"total": len(duplicados), "usuarios": duplicados}
+    except Exception as e:
+        logger.error(f"Error getting duplicate users: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Face pool and per-stage timing metrics
+@api_router.get("/admin/metrics")
+async def get_metrics():
+    return {
+        "face_pool": {
+            "mode": FACE_POOL_MODE,
+            "workers": face_pool_size(),
+            "max_queue": FACE_POOL_MAX_QUEUE,
+            "active": face_pool_active,
+            "rejected": face_pool_rejected,
+            "ready": face_models_available(),
+            "restarts": face_workers.restarts if face_workers is not None else 0,
+            "processes": face_workers.health() if face_workers is not None else [],
+        },
+        "vote_queue": {
+            "enabled": vote_queue is not None,
+            "depth": vote_queue.depth if vote_queue else 0,
+            "flushed": vote_queue.flushed_total if vote_queue else 0,
+            "last_flush_ms": round(vote_queue.last_flush_seconds * 1000, 2) if vote_queue else 0.0,
+            "last_error": vote_queue.last_error if vote_queue else None,
+        },
+        "embedding_batcher": {
+            "max_batch": embedding_batcher.max_batch,
+            "max_wait_ms": FACE_EMBED_BATCH_WAIT_MS,
+            "batches": embedding_batcher.batches,
+            "items": embedding_batcher.items,
+            "avg_batch": round(embedding_batcher.items / embedding_batcher.batches, 2) if embedding_batcher.batches else 0.0,
+            "largest_batch": embedding_batcher.largest_batch,
+        },
+        "stages": {
+            stage: {
+                "count": stats["count"],
+                "avg_ms": round(stats["total"] / stats["count"] * 1000, 2) if stats["count"] else 0.0,
+                "max_ms": round(stats["max"] * 1000, 2),
+            }
+            for stage, stats in stage_stats.items()
+        },
+    }
+
+# Face worker processes: per-worker health, rolling restart and resizing
+def require_face_workers():
+    if face_workers is None:
+        raise HTTPException(status_code=400, detail="Face workers only exist with FACE_POOL_MODE=process or service")
+
+@api_router.get("/admin/face-workers")
+async def get_face_workers():
+    require_face_workers()
+    return {
+        "size": face_workers.size,
+        "restarts": face_workers.restarts,
+        "error": face_workers.halted_error,
+        "load_error": face_workers.load_error,
+        "workers": face_workers.health(),
+    }
+
+@api_router.post("/admin/face-workers/restart")
+async def restart_face_workers():
+    global face_models_ready, face_models_error
+    require_face_workers()
+    try:
+        await face_workers.restart()
+        await face_workers.wait_ready()
+        face_models_ready = True
+        face_models_error = None
+        return {"success": True, "workers": face_workers.health()}
+    except FaceWorkerError as e:
+        logger.error(f"Error restarting face workers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/admin/face-workers/scale")
+async def scale_face_workers(request: FaceWorkersScaleRequest):
+    require_face_workers()
+    if request.workers < 1:
+        raise HTTPException(status_code=400, detail="At least one face worker is required")
+    try:
+        await face_workers.scale(request.workers)
+        logger.info(f"Face workers scaled to {face_workers.size}")
+        return {"success": True, "size": face_workers.size, "workers": face_workers.health()}
+    except FaceWorkerError as e:
+        logger.error(f"Error scaling face workers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Health check
 @api_router.get("/")
 async def root():
-    return {"message": "API de VotaÃ§Ã£o - XXI Feira TecnolÃ³gica Fucapi"}
+    missing_indexes = await get_missing_indexes()
+    return {
+        "message": "API de Votacao - XXI Feira Tecnologica Fucapi",
+        "indexes_ok": not missing_indexes,
+        "missing_indexes": missing_indexes
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -639,9 +1848,38 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     await initialize_admin_password()
+    await initialize_session_secret()
+    await ensure_indexes()
+    await idempotency_cache.ensure_indexes()
+    await migrate_vote_counters()
+    await migrate_vote_rollups()
+    await migrate_turma_fotos()
+    await results_snapshot.load()
+    asyncio.create_task(results_snapshot_refresher())
+    asyncio.create_task(results_broadcaster.run())
+    if vote_queue is not None:
+        replayed = vote_queue.replay()
+        if replayed:
+            logger.info(f"Replaying {replayed} journaled votes")
+        vote_queue.start()
+    if face_workers is not None:
+        face_workers.start()
+    asyncio.create_task(warm_up_face_pool())
+    await load_face_index()
+    asyncio.create_task(backfill_face_index())
+    asyncio.create_task(face_index_refresher())
+    asyncio.create_task(face_index_saver())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if vote_queue is not None:
+        await vote_queue.stop()
+    if face_index_dirty:
+        await save_face_index()
+    if face_workers is not None:
+        await face_workers.stop()
+    else:
+        face_executor.shutdown(wait=False)
     client.close()
 
 
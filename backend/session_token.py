@@ -0,0 +1,57 @@
+"""
+Signed voting session tokens.
+
+A token is base64url(JSON payload) "." base64url(HMAC-SHA256 of the payload).
+The payload carries the user id ("uid") and an expiry timestamp ("exp").
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+
+class InvalidSessionToken(ValueError):
+    pass
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(secret: bytes, payload: str) -> bytes:
+    return hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+
+def sign_session_token(secret: bytes, usuario_id: str, ttl_seconds: int, now: Optional[float] = None) -> str:
+    now = time.time() if now is None else now
+    payload = _b64url(json.dumps({
+        "uid": usuario_id,
+        "exp": int(now) + ttl_seconds
+    }, separators=(",", ":")).encode('utf-8'))
+    return f"{payload}.{_b64url(_sign(secret, payload))}"
+
+
+def verify_session_token(secret: bytes, token: str, now: Optional[float] = None) -> dict:
+    """Return the payload of a valid token; raise InvalidSessionToken if the
+    token is malformed, signed with another secret or expired."""
+    try:
+        payload, signature = token.split(".", 1)
+        if not hmac.compare_digest(_sign(secret, payload), _b64url_decode(signature)):
+            raise InvalidSessionToken("bad signature")
+        sessao = json.loads(_b64url_decode(payload))
+    except InvalidSessionToken:
+        raise
+    except Exception as e:
+        raise InvalidSessionToken(f"malformed token: {e}")
+    if not isinstance(sessao, dict) or 'uid' not in sessao:
+        raise InvalidSessionToken("malformed token")
+    if sessao.get('exp', 0) < (time.time() if now is None else now):
+        raise InvalidSessionToken("expired")
+    return sessao
@@ -0,0 +1,61 @@
+"""
+Storing and counting write-behind vote batches.
+
+Safe to replay: ballots keep the _id chosen at enqueue time and are counted
+once. "contabilizado" goes False -> lote id (claimed) -> True (counted); the
+increments of a lote are idempotent, so a flush interrupted anywhere after the
+claim is finished by the next attempt with the same lote id.
+"""
+
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, List
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+# (lote, ballots per turma, ballot timestamps); must be idempotent per lote
+LoteCallback = Callable[[str, Counter, List[datetime]], Awaitable[None]]
+
+
+async def store_vote_batch(votos, batch: List[dict], count_lote: LoteCallback, release_lote: LoteCallback,
+                           batch_size: int = 500):
+    """Insert the journaled ballots into votos and count every ballot not
+    counted yet: count_lote applies a lote's increments, release_lote runs
+    once its ballots are marked counted and it can no longer be retried."""
+    docs = [
+        {
+            "_id": ObjectId(entry['_id']),
+            "usuario_id": entry['usuario_id'],
+            "turma_id": entry['turma_id'],
+            "timestamp": datetime.fromisoformat(entry['timestamp']),
+            "contabilizado": False
+        }
+        for entry in batch
+    ]
+    try:
+        await votos.insert_many(docs, ordered=False)
+    except BulkWriteError as bwe:
+        # Duplicate keys are ballots already stored by an interrupted flush
+        if any(err.get('code') != 11000 for err in bwe.details.get('writeErrors', [])):
+            raise
+
+    ids = [d['_id'] for d in docs]
+    await votos.update_many(
+        {"_id": {"$in": ids}, "contabilizado": False},
+        {"$set": {"contabilizado": str(ObjectId())}}
+    )
+
+    # Ballots claimed now or by an interrupted attempt, grouped by lote
+    lotes = {}
+    reclamados = votos.find({"_id": {"$in": ids}, "contabilizado": {"$type": "string"}}, {"turma_id": 1, "timestamp": 1, "contabilizado": 1})
+    async for voto in reclamados.batch_size(batch_size):
+        por_turma, horarios, contados = lotes.setdefault(voto['contabilizado'], (Counter(), [], []))
+        por_turma[voto['turma_id']] += 1
+        horarios.append(voto['timestamp'])
+        contados.append(voto['_id'])
+
+    for lote, (por_turma, horarios, contados) in lotes.items():
+        await count_lote(lote, por_turma, horarios)
+        await votos.update_many({"_id": {"$in": contados}, "contabilizado": lote}, {"$set": {"contabilizado": True}})
+        await release_lote(lote, por_turma, horarios)
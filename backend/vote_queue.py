@@ -0,0 +1,247 @@
+"""
+Write-behind queue for ballots.
+
+Votes are appended to a local journal (one JSON object per line) and
+acknowledged once on disk; a background task hands them to a flush callback
+in batches. Entries stay in the journal until the callback succeeds, so after
+a crash the pending votes are replayed on startup.
+
+Journal I/O runs in a thread, never on the event loop, and appends from
+concurrent votes are group-committed: one write and one fsync per group.
+
+Each process (API worker) writes its own journal, journal_path.N, claimed
+with an exclusive file lock held while the process runs, so workers never
+rewrite each other's entries. On replay, journals whose lock is free (their
+worker is gone) are adopted by the replaying process.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+MAX_JOURNAL_SLOTS = 256
+
+
+def _try_lock(fh) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class VoteQueue:
+
+    def __init__(self, journal_path: str, flush: Callable[[List[dict]], Awaitable[None]],
+                 flush_interval: float = 1.0, max_batch: int = 500, fsync: bool = True):
+        self.journal_path = journal_path
+        self.flush_callback = flush
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.pending: List[dict] = []
+        self.flushed_total = 0
+        self.last_flush_seconds = 0.0
+        self.last_error = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        # Serializes appends and rewrites, so the file always matches pending
+        self._file_lock = asyncio.Lock()
+        self._to_write: List[tuple] = []  # (entry, future) waiting for the next group commit
+        self._writer = None
+        self._task = None
+        self._path: Optional[str] = None  # journal claimed by this process
+        self._lock_file = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    @property
+    def path(self) -> str:
+        """Journal file of this process, claimed on first use."""
+        if self._path is None:
+            self._claim()
+        return self._path
+
+    def _claim(self):
+        for slot in range(MAX_JOURNAL_SLOTS):
+            path = f"{self.journal_path}.{slot}"
+            lock_file = open(f"{path}.lock", "a")
+            if _try_lock(lock_file):
+                self._path, self._lock_file = path, lock_file
+                return
+            lock_file.close()
+        raise RuntimeError(f"No free vote journal slot for {self.journal_path}")
+
+    def _orphan_journals(self) -> List[str]:
+        # The single journal written before there was one per worker, then
+        # every slot not held by a running process
+        paths = [self.journal_path]
+        pattern = re.compile(re.escape(self.journal_path) + r"\.\d+")
+        paths += sorted(p for p in glob.glob(glob.escape(self.journal_path) + ".*") if pattern.fullmatch(p))
+        return [p for p in paths if p != self.path and os.path.exists(p)]
+
+    def _adopt(self, orphan: str) -> int:
+        lock_file = open(f"{orphan}.lock", "a")
+        try:
+            if not _try_lock(lock_file):
+                return 0  # its worker is running
+            with open(orphan, "r", encoding="utf-8") as fh:
+                lines = [line for line in fh.read().splitlines() if line.strip()]
+            if lines:
+                # Appended before the orphan is removed: a crash in between only
+                # duplicates ballots, and flushing a ballot twice is harmless
+                with open(self.path, "a", encoding="utf-8") as fh:
+                    fh.write("".join(line + "\n" for line in lines))
+                    fh.flush()
+                    if self.fsync:
+                        os.fsync(fh.fileno())
+            os.remove(orphan)
+            return len(lines)
+        finally:
+            lock_file.close()
+
+    def replay(self) -> int:
+        """Load entries left in this process's journal, and in the journals
+        of workers no longer running, by previous processes."""
+        self.pending = []
+        for orphan in self._orphan_journals():
+            adopted = self._adopt(orphan)
+            if adopted:
+                logger.info(f"Adopted {adopted} journaled votes from {orphan}")
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self.pending.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write; that vote was never acknowledged
+                    logger.warning(f"Skipping corrupt vote journal line: {line[:80]}")
+        return len(self.pending)
+
+    async def enqueue(self, entry: dict):
+        """Durably append an entry. Returns once it is on disk; raises if it
+        could not be written (the entry is then not queued)."""
+        future = asyncio.get_running_loop().create_future()
+        self._to_write.append((entry, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_groups())
+        await future
+
+    async def _write_groups(self):
+        while self._to_write:
+            group, self._to_write = self._to_write, []
+            entries = [entry for entry, _ in group]
+            try:
+                async with self._file_lock:
+                    await asyncio.to_thread(self._append, entries)
+                    self.pending.extend(entries)
+            except Exception as e:
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for _, future in group:
+                if not future.done():
+                    future.set_result(None)
+            if len(self.pending) >= self.max_batch:
+                self._wakeup.set()
+
+    def _append(self, entries: List[dict]):
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+
+    def _write_journal(self, entries: List[dict]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for entry in entries:
+                fh.write(json.dumps(entry) + "\n")
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        async with self._lock:
+            while self.pending:
+                batch = self.pending[:self.max_batch]
+                start = time.perf_counter()
+                await self.flush_callback(batch)
+                self.last_flush_seconds = time.perf_counter() - start
+                # Entries appended meanwhile stay after the flushed prefix
+                async with self._file_lock:
+                    del self.pending[:len(batch)]
+                    await asyncio.to_thread(self._write_journal, list(self.pending))
+                self.flushed_total += len(batch)
+
+    async def discard(self):
+        """Drop every pending entry (used when all votes are reset)."""
+        async with self._lock:
+            async with self._file_lock:
+                self.pending = []
+                await asyncio.to_thread(self._write_journal, [])
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error flushing vote queue ({self.depth} pending): {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        """Release this process's journal; entries left in it are adopted by
+        the next process that replays."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self._path = None
@@ -30,6 +30,32 @@ export default function AdminDashboard() {
     checkAuth();
     loadResults();
 
+    // Live updates pushed by the server when EventSource is available (web)
+    if (typeof EventSource !== 'undefined') {
+      const source = new EventSource(`${EXPO_PUBLIC_BACKEND_URL}/api/admin/results/stream`);
+
+      source.addEventListener('snapshot', (event: MessageEvent) => {
+        const data = JSON.parse(event.data);
+        setTotalVotos(data.total_votos);
+        setResults(data.turmas);
+        setLoading(false);
+      });
+
+      source.addEventListener('diff', (event: MessageEvent) => {
+        const data = JSON.parse(event.data);
+        setTotalVotos(data.total_votos);
+        setResults((current) =>
+          current
+            .map((turma) =>
+              turma._id in data.counts ? { ...turma, votos_count: data.counts[turma._id] } : turma
+            )
+            .sort((a, b) => b.votos_count - a.votos_count)
+        );
+      });
+
+      return () => source.close();
+    }
+
     // Auto refresh every 5 seconds
     const interval = setInterval(() => {
       loadResults(true);
@@ -14,7 +14,8 @@ interface Turma {
   nome_turma: string;
   nome_projeto: string;
   numero_barraca: string;
-  foto_base64: string;
+  foto_url: string | null;
+  foto_thumb_url: string | null;
   votos_count: number;
 }
 
@@ -31,6 +32,8 @@ export default function AdminTurmasScreen() {
   const [nomeProjeto, setNomeProjeto] = useState('');
   const [numeroBarraca, setNumeroBarraca] = useState('');
   const [fotoBase64, setFotoBase64] = useState('');
+  // Current photo of the turma being edited (kept unless a new one is picked)
+  const [fotoAtualUrl, setFotoAtualUrl] = useState<string | null>(null);
 
   useEffect(() => {
     checkAuth();
@@ -84,7 +87,7 @@ export default function AdminTurmasScreen() {
       return;
     }
 
-    if (!fotoBase64) {
+    if (!fotoBase64 && !fotoAtualUrl) {
       Alert.alert('AtenÃ§Ã£o', 'Selecione uma foto do projeto');
       return;
     }
@@ -98,7 +101,7 @@ export default function AdminTurmasScreen() {
           nome_turma: nomeTurma.trim(),
           nome_projeto: nomeProjeto.trim(),
           numero_barraca: numeroBarraca.trim(),
-          foto_base64: fotoBase64,
+          foto_base64: fotoBase64 || undefined,
         });
         Alert.alert('Sucesso', 'Turma atualizada com sucesso!');
       } else {
@@ -129,7 +132,8 @@ export default function AdminTurmasScreen() {
     setNomeTurma(turma.nome_turma);
     setNomeProjeto(turma.nome_projeto);
     setNumeroBarraca(turma.numero_barraca);
-    setFotoBase64(turma.foto_base64);
+    setFotoBase64('');
+    setFotoAtualUrl(turma.foto_url);
     setModalVisible(true);
   };
 
@@ -163,6 +167,7 @@ export default function AdminTurmasScreen() {
     setNomeProjeto('');
     setNumeroBarraca('');
     setFotoBase64('');
+    setFotoAtualUrl(null);
   };
 
   return (
@@ -203,7 +208,7 @@ export default function AdminTurmasScreen() {
           turmas.map((turma) => (
             <View key={turma._id} style={styles.turmaCard}>
               <Image
-                source={{ uri: `data:image/jpeg;base64,${turma.foto_base64}` }}
+                source={{ uri: turma.foto_thumb_url ? `${EXPO_PUBLIC_BACKEND_URL}${turma.foto_thumb_url}` : undefined }}
                 style={styles.turmaImage}
               />
               <View style={styles.turmaInfo}>
@@ -286,7 +291,7 @@ export default function AdminTurmasScreen() {
               >
                 <Ionicons name="image-outline" size={24} color="#667eea" />
                 <Text style={styles.imagePickerText}>
-                  {fotoBase64 ? 'Foto Selecionada âœ“' : 'Selecionar Foto do Projeto'}
+                  {fotoBase64 || fotoAtualUrl ? 'Foto Selecionada âœ“' : 'Selecionar Foto do Projeto'}
                 </Text>
               </TouchableOpacity>
 
@@ -295,6 +300,11 @@ export default function AdminTurmasScreen() {
                   source={{ uri: `data:image/jpeg;base64,${fotoBase64}` }}
                   style={styles.previewImage}
                 />
+              ) : fotoAtualUrl ? (
+                <Image
+                  source={{ uri: `${EXPO_PUBLIC_BACKEND_URL}${fotoAtualUrl}` }}
+                  style={styles.previewImage}
+                />
               ) : null}
 
               <TouchableOpacity
@@ -59,7 +59,7 @@ export default function CameraScreen() {
       if (response.data.found) {
         const usuario = response.data.usuario;
 
-        if (usuario.ja_votou) {
+        if (response.data.ja_votou ?? usuario.ja_votou) {
           Alert.alert('Atenção', 'Você já realizou sua votação!', [
             {
               text: 'OK',
@@ -69,7 +69,7 @@ export default function CameraScreen() {
         } else {
           router.push({
             pathname: '/voting',
-            params: { usuario_id: usuario.id },
+            params: { usuario_id: usuario.id, session_token: response.data.session_token },
           });
         }
       } else {
@@ -1,4 +1,4 @@
-﻿import React, { useState } from 'react';
+﻿import React, { useRef, useState } from 'react';
 import {
   View,
   Text,
@@ -23,6 +23,8 @@ export default function RegisterScreen() {
   const router = useRouter();
   const params = useLocalSearchParams();
   const faceImage = params.face_image as string;
+  // Same key for every retry of this registration, so the backend replays instead of failing on the CPF check
+  const idempotencyKey = useRef(`register-${Date.now()}-${Math.random().toString(36).slice(2)}`);
 
   const [nome, setNome] = useState('');
   const [cpf, setCpf] = useState('');
@@ -99,7 +101,7 @@ export default function RegisterScreen() {
           face_image: faceImage,
           lgpd_aceito: true,
         },
-        { timeout: 30000 }
+        { timeout: 30000, headers: { 'Idempotency-Key': idempotencyKey.current } }
       );
 
       if (response.data.success) {
@@ -109,7 +111,10 @@ export default function RegisterScreen() {
             onPress: () => {
               router.push({
                 pathname: '/voting',
-                params: { usuario_id: response.data.usuario_id },
+                params: {
+                  usuario_id: response.data.usuario_id,
+                  session_token: response.data.session_token,
+                },
               });
             },
           },
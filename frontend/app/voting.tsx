@@ -1,4 +1,4 @@
-﻿import React, { useState, useEffect } from 'react';
+﻿import React, { useState, useEffect, useRef } from 'react';
 import { View, Text, StyleSheet, FlatList, TouchableOpacity, Image, Alert, ActivityIndicator, Dimensions } from 'react-native';
 import { useRouter, useLocalSearchParams } from 'expo-router';
 import axios from 'axios';
@@ -14,14 +14,17 @@ interface Turma {
   nome_turma: string;
   nome_projeto: string;
   numero_barraca: string;
-  foto_base64: string;
-  votos_count: number;
+  foto_thumb_url: string | null;
 }
 
 export default function VotingScreen() {
   const router = useRouter();
   const params = useLocalSearchParams();
   const usuarioId = params.usuario_id as string;
+  // Issued by verify-face / register; proves this visitor may vote
+  const sessionToken = params.session_token as string;
+  // Retrying the vote for the same turma replays the first answer instead of "already voted"
+  const voteSessionKey = useRef(`vote-${Date.now()}-${Math.random().toString(36).slice(2)}`);
 
   const [turmas, setTurmas] = useState<Turma[]>([]);
   const [loading, setLoading] = useState(true);
@@ -47,10 +50,15 @@ export default function VotingScreen() {
     try {
       setVoting(true);
 
-      const response = await axios.post(`${EXPO_PUBLIC_BACKEND_URL}/api/vote`, {
-        usuario_id: usuarioId,
-        turma_id: turmaId,
-      });
+      const response = await axios.post(
+        `${EXPO_PUBLIC_BACKEND_URL}/api/vote`,
+        {
+          usuario_id: usuarioId,
+          turma_id: turmaId,
+          session_token: sessionToken,
+        },
+        { headers: { 'Idempotency-Key': `${voteSessionKey.current}-${turmaId}` } }
+      );
 
       if (response.data.success) {
         router.push({
@@ -78,7 +86,7 @@ export default function VotingScreen() {
       activeOpacity={0.9}
     >
       <Image
-        source={{ uri: `data:image/jpeg;base64,${item.foto_base64}` }}
+        source={{ uri: item.foto_thumb_url ? `${EXPO_PUBLIC_BACKEND_URL}${item.foto_thumb_url}` : undefined }}
         style={styles.cardImage}
       />
       <LinearGradient
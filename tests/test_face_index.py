@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_index import create_face_index, index_fingerprint
+
+# Small IVF settings so 64 embeddings are enough to train the centroids
+IVF_OPTIONS = {"n_lists": 4, "nprobe": 4, "train_min_per_list": 8}
+
+
+def make_index(kind):
+    return create_face_index(kind, **(IVF_OPTIONS if kind == "ivf" else {}))
+
+
+def user_id(n):
+    return f"{n:024x}"
+
+
+def embeddings(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, 128)).astype(np.float32)
+
+
+@pytest.fixture(params=["exact", "ivf"])
+def filled_index(request):
+    index = make_index(request.param)
+    for n, vector in enumerate(embeddings(64)):
+        index.add(user_id(n), vector)
+    return index
+
+
+def test_search_finds_the_stored_embedding(filled_index):
+    vectors = embeddings(64)
+    for n in (0, 17, 63):
+        (found, distance), = filled_index.search(vectors[n], k=1)
+        assert found == user_id(n)
+        assert distance == pytest.approx(0.0, abs=1e-5)
+
+
+def test_ivf_index_trains_once_large_enough():
+    index = make_index("ivf")
+    for n, vector in enumerate(embeddings(31)):
+        index.add(user_id(n), vector)
+    assert not index.trained
+    index.add(user_id(31), embeddings(1, seed=1)[0])
+    assert index.trained
+
+
+def test_remove(filled_index):
+    vectors = embeddings(64)
+    assert filled_index.remove(user_id(5))
+    assert not filled_index.remove(user_id(5))
+    assert user_id(5) not in filled_index
+    assert len(filled_index) == 63
+    assert all(found != user_id(5) for found, _ in filled_index.search(vectors[5], k=63))
+    # The row moved into the removed slot is still found
+    (found, _), = filled_index.search(vectors[63], k=1)
+    assert found == user_id(63)
+
+
+def test_save_and_load_round_trip(filled_index, tmp_path):
+    path = str(tmp_path / "face_index.npz")
+    filled_index.save(path)
+    assert os.listdir(tmp_path) == ["face_index.npz"]
+
+    loaded = make_index(filled_index.kind)
+    assert loaded.load(path) == index_fingerprint(64, user_id(63))
+    assert len(loaded) == 64
+    if filled_index.kind == "ivf":
+        assert loaded.trained
+
+    for query in embeddings(5, seed=2):
+        expected = filled_index.search(query, k=3)
+        hits = loaded.search(query, k=3)
+        assert [found for found, _ in hits] == [found for found, _ in expected]
+        assert [distance for _, distance in hits] == pytest.approx([distance for _, distance in expected])
+
+
+def test_fingerprint_follows_the_content(filled_index, tmp_path):
+    path = str(tmp_path / "face_index.npz")
+    filled_index.remove(user_id(63))
+    filled_index.save(path)
+    assert make_index(filled_index.kind).load(path) == index_fingerprint(63, user_id(62))
+
+
+def test_load_rejects_a_file_of_another_backend(tmp_path):
+    path = str(tmp_path / "face_index.npz")
+    index = make_index("exact")
+    index.add(user_id(1), embeddings(1)[0])
+    index.save(path)
+    with pytest.raises(ValueError):
+        make_index("ivf").load(path)
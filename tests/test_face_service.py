@@ -0,0 +1,97 @@
+import asyncio
+import math
+import operator
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import pytest
+
+from face_service import FaceService, FaceServiceClient, FaceServiceUnavailable, parse_address
+from face_worker import FaceWorkerError
+
+AUTHKEY = b"test-key"
+
+
+class FakePool:
+    """FaceWorkerPool interface running tasks inline."""
+
+    def __init__(self, size):
+        self.size = size
+        self.restarts = 0
+        self.halted_error = None
+        self.load_error = None
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def run(self, fn, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            raise FaceWorkerError(f"{type(e).__name__}: {e}")
+
+    async def wait_ready(self):
+        pass
+
+    async def restart(self):
+        self.restarts += 1
+
+    async def scale(self, size):
+        self.size = size
+
+    def health(self):
+        return [{"id": i, "ready": True} for i in range(self.size)]
+
+
+@pytest.fixture
+def service_address():
+    service = FaceService(FakePool(2))
+    service.start()
+    listener = Listener(("127.0.0.1", 0), backlog=16)
+    threading.Thread(target=service.serve, args=(listener, AUTHKEY), daemon=True).start()
+    yield "%s:%d" % listener.address
+    service.stop()
+
+
+def test_parse_address():
+    assert parse_address("127.0.0.1:8765") == ("127.0.0.1", 8765)
+    assert parse_address("/run/face.sock") == "/run/face.sock"
+
+
+def test_client_runs_tasks_and_mirrors_the_pool(service_address):
+    async def main():
+        client = FaceServiceClient(service_address, AUTHKEY, size=1, threads=4)
+        await client.wait_ready()
+        results = await asyncio.gather(*[client.run(operator.mul, i, 2) for i in range(10)])
+        with pytest.raises(FaceWorkerError, match="ValueError"):
+            await client.run(math.sqrt, -1)
+        await client.scale(3)
+        await client.restart()
+        await client.stop()
+        return client, results
+
+    client, results = asyncio.run(main())
+    assert results == [i * 2 for i in range(10)]
+    assert (client.size, client.restarts, client.halted_error) == (3, 1, None)
+    assert len(client.health()) == 3
+
+
+def test_wrong_authkey_is_rejected(service_address):
+    client = FaceServiceClient(service_address, b"wrong", size=1)
+    with pytest.raises(AuthenticationError):
+        asyncio.run(client.run(operator.mul, 1, 2))
+
+
+def test_unreachable_service_halts_the_client():
+    async def main():
+        client = FaceServiceClient("127.0.0.1:1", AUTHKEY, size=1)
+        with pytest.raises(FaceServiceUnavailable):
+            await client.run(operator.mul, 1, 2)
+        await client.refresh()
+        return client
+
+    assert asyncio.run(main()).halted_error.startswith("Face service unavailable")
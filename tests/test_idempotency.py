@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyCache, IdempotencyKeyReused
+
+
+class FakeCollection:
+    """The Motor calls IdempotencyCache makes, each yielding to the event loop."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        await asyncio.sleep(0)
+        return self.docs.get(query["_id"])
+
+    async def replace_one(self, query, doc, upsert=False):
+        await asyncio.sleep(0)
+        self.docs[query["_id"]] = doc
+
+    async def delete_many(self, query):
+        await asyncio.sleep(0)
+        self.docs.clear()
+
+
+def counting_handler(calls, body, fail=False):
+    async def handler():
+        calls.append(body)
+        # Long enough for concurrent retries to arrive while this one runs
+        await asyncio.sleep(0.01)
+        if fail:
+            raise RuntimeError("boom")
+        return body
+    return handler
+
+
+def test_concurrent_retries_run_the_handler_once():
+    calls = []
+
+    async def main():
+        cache = IdempotencyCache(10, 60, FakeCollection())
+        return await asyncio.gather(*[
+            cache.run("vote:k", "fp", counting_handler(calls, {"ok": True})) for _ in range(5)
+        ])
+
+    results = asyncio.run(main())
+    assert calls == [{"ok": True}]
+    assert results[0] == (False, {"ok": True})
+    assert results[1:] == [(True, {"ok": True})] * 4
+
+
+def test_retry_waiting_on_a_failed_attempt_runs_again():
+    calls = []
+
+    async def main():
+        cache = IdempotencyCache(10, 60)
+        first = asyncio.ensure_future(cache.run("vote:k", "fp", counting_handler(calls, "first", fail=True)))
+        await asyncio.sleep(0)
+        second = await cache.run("vote:k", "fp", counting_handler(calls, "second"))
+        with pytest.raises(RuntimeError):
+            await first
+        return second, cache
+
+    second, cache = asyncio.run(main())
+    assert calls == ["first", "second"]
+    assert second == (False, "second")
+    assert cache.inflight == {}
+
+
+def test_key_reused_for_another_request_is_rejected():
+    async def main():
+        cache = IdempotencyCache(10, 60)
+        await cache.run("vote:k", "fp", counting_handler([], "body"))
+        await cache.run("vote:k", "other", counting_handler([], "body"))
+
+    with pytest.raises(IdempotencyKeyReused):
+        asyncio.run(main())
+
+
+def test_stored_responses_are_shared_through_the_collection_and_cleared():
+    collection = FakeCollection()
+    calls = []
+
+    async def main():
+        worker_a = IdempotencyCache(10, 60, collection)
+        worker_b = IdempotencyCache(10, 60, collection)
+        await worker_a.run("register:k", "fp", counting_handler(calls, "a"))
+        replayed = await worker_b.run("register:k", "fp", counting_handler(calls, "b"))
+        await worker_b.clear()
+        return replayed, await worker_b.get("register:k")
+
+    replayed, after_clear = asyncio.run(main())
+    assert replayed == (True, "a")
+    assert calls == ["a"]
+    assert after_clear is None
+    assert collection.docs == {}
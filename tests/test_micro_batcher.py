@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+def test_concurrent_items_are_batched_up_to_max_batch():
+    batches = []
+
+    async def run_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=4, max_wait=1.0)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(8)])
+        return batcher, results
+
+    batcher, results = asyncio.run(main())
+    assert results == [i * 10 for i in range(8)]
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert (batcher.batches, batcher.items, batcher.largest_batch) == (2, 8, 4)
+
+
+def test_partial_batch_is_flushed_by_the_timer():
+    batches = []
+
+    async def run_batch(items):
+        batches.append(list(items))
+        return [item + 1 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=8, max_wait=0.01)
+        return await asyncio.wait_for(asyncio.gather(*[batcher.submit(i) for i in range(3)]), timeout=1.0)
+
+    assert asyncio.run(main()) == [1, 2, 3]
+    assert batches == [[0, 1, 2]]
+
+
+def test_failed_batch_fails_every_caller():
+    async def run_batch(items):
+        raise RuntimeError("model crashed")
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=2, max_wait=0.01)
+        return await asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(r, RuntimeError) and str(r) == "model crashed" for r in results)
+
+
+def test_batch_with_wrong_number_of_results_fails():
+    async def run_batch(items):
+        return items[:-1]
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=2, max_wait=0.01)
+        await asyncio.gather(batcher.submit(1), batcher.submit(2))
+
+    with pytest.raises(RuntimeError, match="returned 1 results"):
+        asyncio.run(main())
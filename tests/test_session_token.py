@@ -0,0 +1,37 @@
+import pytest
+
+from session_token import InvalidSessionToken, sign_session_token, verify_session_token
+
+SECRET = b"0123456789abcdef"
+
+
+def test_signed_token_verifies_and_carries_the_user():
+    token = sign_session_token(SECRET, "user-1", ttl_seconds=600, now=1000)
+    sessao = verify_session_token(SECRET, token, now=1599)
+    assert sessao == {"uid": "user-1", "exp": 1600}
+
+
+def test_expired_token_is_rejected():
+    token = sign_session_token(SECRET, "user-1", ttl_seconds=600, now=1000)
+    with pytest.raises(InvalidSessionToken, match="expired"):
+        verify_session_token(SECRET, token, now=1601)
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    token = sign_session_token(b"another secret", "user-1", ttl_seconds=600)
+    with pytest.raises(InvalidSessionToken):
+        verify_session_token(SECRET, token)
+
+
+def test_tampered_payload_is_rejected():
+    token = sign_session_token(SECRET, "user-1", ttl_seconds=600)
+    other = sign_session_token(SECRET, "user-2", ttl_seconds=600)
+    forged = other.split(".")[0] + "." + token.split(".")[1]
+    with pytest.raises(InvalidSessionToken):
+        verify_session_token(SECRET, forged)
+
+
+@pytest.mark.parametrize("token", ["", "no-dot", "a.b", "...", "bm90IGpzb24.c2ln"])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(InvalidSessionToken):
+        verify_session_token(SECRET, token)
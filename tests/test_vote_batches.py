@@ -0,0 +1,140 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from vote_batches import store_vote_batch
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if condition.get("$type") == "string" and not isinstance(value, str):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            await asyncio.sleep(0)
+            yield doc
+
+
+class FakeVotos:
+    """The Motor calls store_vote_batch makes on votos, each yielding to the event loop."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(0)
+        errors = []
+        for doc in docs:
+            if doc["_id"] in self.docs:
+                errors.append({"code": 11000})
+            else:
+                self.docs[doc["_id"]] = dict(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def update_many(self, query, update):
+        await asyncio.sleep(0)
+        for doc in self.docs.values():
+            if matches(doc, query):
+                doc.update(update["$set"])
+
+    def find(self, query, projection):
+        return FakeCursor([dict(doc) for doc in self.docs.values() if matches(doc, query)])
+
+
+class FakeCounters:
+    """Lote-idempotent increments, like the sharded counters: a lote applied
+    again (a retried flush) changes nothing."""
+
+    def __init__(self, fail_times=0):
+        self.applied = {}
+        self.released = []
+        self.fail_times = fail_times
+
+    async def count(self, lote, por_turma, horarios):
+        await asyncio.sleep(0)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("flush interrupted")
+        self.applied.setdefault(lote, Counter(por_turma))
+
+    async def release(self, lote, por_turma, horarios):
+        self.released.append(lote)
+
+    def totals(self):
+        return sum(self.applied.values(), Counter())
+
+
+def ballots(turmas):
+    return [
+        {"_id": str(ObjectId()), "usuario_id": f"u{i}", "turma_id": turma, "timestamp": "2026-10-18T10:00:00"}
+        for i, turma in enumerate(turmas)
+    ]
+
+
+def test_replayed_batch_is_not_counted_again():
+    votos, counters = FakeVotos(), FakeCounters()
+    batch = ballots(["a", "a", "b"])
+
+    async def main():
+        await store_vote_batch(votos, batch, counters.count, counters.release)
+        # The journal is replayed after a crash that followed the flush
+        await store_vote_batch(votos, batch, counters.count, counters.release)
+
+    asyncio.run(main())
+    assert counters.totals() == Counter({"a": 2, "b": 1})
+    assert all(doc["contabilizado"] is True for doc in votos.docs.values())
+    assert len(counters.released) == 1
+
+
+def test_interrupted_flush_is_finished_with_the_same_lote():
+    votos, counters = FakeVotos(), FakeCounters(fail_times=1)
+    batch = ballots(["a", "b", "b"])
+
+    async def main():
+        with pytest.raises(ConnectionError):
+            await store_vote_batch(votos, batch, counters.count, counters.release)
+        claimed = {doc["contabilizado"] for doc in votos.docs.values()}
+        await store_vote_batch(votos, batch + ballots(["c"]), counters.count, counters.release)
+        return claimed
+
+    claimed = asyncio.run(main())
+    assert len(claimed) == 1
+    assert claimed.pop() in counters.applied
+    assert counters.totals() == Counter({"a": 1, "b": 2, "c": 1})
+    assert all(doc["contabilizado"] is True for doc in votos.docs.values())
+
+
+def test_concurrent_flushes_of_the_same_ballots_count_them_once():
+    votos, counters = FakeVotos(), FakeCounters()
+    batch = ballots(["a", "b", "c", "a"])
+
+    async def main():
+        await asyncio.gather(*[store_vote_batch(votos, batch, counters.count, counters.release) for _ in range(3)])
+
+    asyncio.run(main())
+    assert counters.totals() == Counter({"a": 2, "b": 1, "c": 1})
+    assert len(votos.docs) == 4
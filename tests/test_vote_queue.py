@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from vote_queue import VoteQueue
+
+
+def ballot(n):
+    return {"_id": f"b{n}", "usuario_id": f"u{n}", "turma_id": "t1"}
+
+
+def journal_entries(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+async def no_flush(batch):
+    raise AssertionError("flush should not run")
+
+
+def test_enqueued_votes_are_replayed_after_a_crash(tmp_path):
+    journal = str(tmp_path / "votos.journal")
+
+    async def main():
+        queue = VoteQueue(journal, no_flush, fsync=False)
+        await asyncio.gather(*[queue.enqueue(ballot(n)) for n in range(5)])
+        # The process dies: its journal lock is released, its journal stays
+        queue.close()
+        return queue.depth
+
+    assert asyncio.run(main()) == 5
+
+    # A new process finds the same ballots, in order
+    replayed = VoteQueue(journal, no_flush, fsync=False)
+    assert replayed.replay() == 5
+    assert replayed.pending == [ballot(n) for n in range(5)]
+
+
+def test_each_process_writes_its_own_journal(tmp_path):
+    journal = str(tmp_path / "votos.journal")
+
+    async def main():
+        first = VoteQueue(journal, no_flush, fsync=False)
+        second = VoteQueue(journal, no_flush, fsync=False)
+        await first.enqueue(ballot(1))
+        await second.enqueue(ballot(2))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first.path != second.path
+    assert journal_entries(first.path) == [ballot(1)]
+    assert journal_entries(second.path) == [ballot(2)]
+
+    # A live worker's journal is left alone by a replaying one
+    third = VoteQueue(journal, no_flush, fsync=False)
+    assert third.replay() == 0
+
+    # Once its worker is gone, the journal is adopted
+    first.close()
+    assert third.replay() == 1
+    assert third.pending == [ballot(1)]
+    assert not os.path.exists(f"{journal}.0")
+    assert journal_entries(third.path) == [ballot(1)]
+
+
+def test_single_journal_of_an_older_version_is_adopted(tmp_path):
+    journal = tmp_path / "votos.journal"
+    journal.write_text(json.dumps(ballot(1)) + "\n", encoding="utf-8")
+
+    queue = VoteQueue(str(journal), no_flush, fsync=False)
+    assert queue.replay() == 1
+    assert queue.pending == [ballot(1)]
+    assert not journal.exists()
+
+
+def test_replay_skips_a_torn_last_line(tmp_path):
+    journal = tmp_path / "votos.journal"
+    (tmp_path / "votos.journal.0").write_text(json.dumps(ballot(1)) + "\n" + '{"_id": "b2", "usu', encoding="utf-8")
+
+    queue = VoteQueue(str(journal), no_flush, fsync=False)
+    assert queue.replay() == 1
+    assert queue.pending == [ballot(1)]
+
+
+def test_failed_flush_keeps_only_unflushed_votes_in_the_journal(tmp_path):
+    journal = str(tmp_path / "votos.journal")
+    flushed = []
+
+    async def flush(batch):
+        if flushed:
+            raise ConnectionError("database down")
+        flushed.append(list(batch))
+
+    async def main():
+        queue = VoteQueue(journal, flush, max_batch=2, fsync=False)
+        for n in range(5):
+            await queue.enqueue(ballot(n))
+        with pytest.raises(ConnectionError):
+            await queue.flush()
+        return queue
+
+    queue = asyncio.run(main())
+    assert flushed == [[ballot(0), ballot(1)]]
+    assert queue.pending == [ballot(n) for n in range(2, 5)]
+    assert queue.flushed_total == 2
+    assert journal_entries(queue.path) == [ballot(n) for n in range(2, 5)]
+
+
+def test_votes_enqueued_during_a_flush_stay_in_the_journal(tmp_path):
+    journal = str(tmp_path / "votos.journal")
+
+    async def main():
+        queue = None
+
+        async def flush(batch):
+            if batch[0] == ballot(9):
+                raise ConnectionError("database down")
+            # A vote acknowledged while this batch is being written
+            await queue.enqueue(ballot(9))
+
+        queue = VoteQueue(journal, flush, max_batch=10, fsync=False)
+        await queue.enqueue(ballot(0))
+        await queue.enqueue(ballot(1))
+        with pytest.raises(ConnectionError):
+            await queue.flush()
+        return queue
+
+    queue = asyncio.run(main())
+    assert queue.pending == [ballot(9)]
+    assert queue.flushed_total == 2
+    assert journal_entries(queue.path) == [ballot(9)]
+
+
+def test_discard_empties_queue_and_journal(tmp_path):
+    journal = str(tmp_path / "votos.journal")
+
+    async def main():
+        queue = VoteQueue(journal, no_flush, fsync=False)
+        await queue.enqueue(ballot(1))
+        await queue.discard()
+        return queue
+
+    queue = asyncio.run(main())
+    assert queue.depth == 0
+    assert journal_entries(queue.path) == []